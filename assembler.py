@@ -1,7 +1,10 @@
-import math, re
+import math, os, re
+from concurrent.futures import ProcessPoolExecutor
 from data.classes import *
+from data.ir import *
 import data.pbr_globals as globals_
 import data.ops as ops
+from folder import fold_function, to_signed
 
 op_to_asm = {
     '+': 'add',
@@ -34,12 +37,24 @@ inv_comps = {'eq': 'ne', 'ne': 'eq',
              'gt': 'le', 'ge': 'lt',
              'lt': 'ge', 'le': 'gt'}
 
-var_pattern = r'@(INT|FLOAT)\(([_a-zA-Z0-9]+)\)'
-branch_pattern = r'@BRANCH\(([0-9]+)\)'
+precolored_pattern = r'_([fr][0-9]+)_'
+spill_pattern = r'_spill[0-9]+_'
+
+# results that only depend on the operands, so the same operation on
+# the same values gives the same value
+pure_ops = (ops.math_ops - {'andi.'}) | {'li', 'lis'}
+commutative_ops = {'add', 'mullw', 'and', 'fadds', 'fmuls'}
+
+# registers for values that don't have to outlive a call
+temp_registers = {'int': ['r0'] + [f'r{n}' for n in range(3, 13)],
+                  'float': [f'f{n}' for n in range(14)]}
+# and for those that do, which the frame has to save; given out from
+# r31/f31 down
+saved_registers = {'int': [f'r{n}' for n in range(31, 13, -1)],
+                   'float': [f'f{n}' for n in range(31, 13, -1)]}
 
 def is_pow_of_two(n):
-    x = math.log(n, 2)
-    return x == int(x)
+    return n > 0 and n & (n - 1) == 0
 
 def is_mask_contiguous(mask):
     if mask & 0x80000000:
@@ -53,77 +68,438 @@ def get_mask_bounds(mask):
     return (b.find('1'), b.rfind('1'))
   return (b.rfind('0') + 1, b.find('0') - 1)
 
-def split_op(op):
-    args = re.split(r'@INT|@FLOAT|[ ,(){}]+', op)
-    return [arg for arg in args if arg != '']
+# indices of the bits set in a bitset
+def set_bits(bits):
+    while bits:
+        bit = bits & -bits
+        bits ^= bit
+        yield bit.bit_length() - 1
 
 # "updates" = uses var being set as an arg as well
 def op_sets_var(op, var, include_updates=True):
-    args = split_op(op)
-    return (args[0] in ops.load_ops \
-            or args[0] in ops.math_ops \
-            or args[0] in ['li', 'lis', 'fmr', 'mr']) \
-            and args[1] == var \
-            and (include_updates or var not in args[2:])
+    return (op.opcode in ops.load_ops \
+            or op.opcode in ops.math_ops \
+            or op.opcode in ['li', 'lis', 'fmr', 'mr']) \
+            and op.operands[0] == var \
+            and (include_updates or var not in op.registers()[1:])
 
 def is_call(op):
-    return split_op(op)[0] in ['bl', 'bctrl']
+    return op.opcode in ['bl', 'bctrl']
 
 def is_branch(op):
-    return split_op(op)[0] in ops.branch_ops
-
-def is_unconditional_branch(op):
-    return split_op(op)[0] in ['b', 'bctr']
+    return op.opcode in ops.branch_ops
 
 def is_move(op):
-    return split_op(op)[0] in ['mr', 'fmr']
+    return op.opcode in ['mr', 'fmr']
+
+def branch_target(op):
+    if len(op.operands) > 0 and type(op.operands[-1]) is Label:
+        return op.operands[-1]
+    return None
+
+# registers read as a base address, where r0 would read as 0
+def get_base_registers(op):
+    if op.opcode in {'addi', 'subi'}:
+        return [op.operands[1]]
+    elif op.opcode in ops.load_ops | ops.store_ops:
+        if op.opcode[-1] == 'x':
+            return list(op.operands[1:])
+        elif type(op.operands[1]) is Mem:
+            return [op.operands[1].base]
+    return []
+
+def fits_immediate(n):
+    return -0x8000 <= n <= 0x7fff
+
+# loads and stores that also write back their address
+def is_update(op):
+    return op.opcode[-1] == 'u' or op.opcode[-2:] == 'ux'
+
+# registers a line might change, erring on the side of more
+def get_changed_registers(op):
+    if type(op) is Label:
+        return []
+    elif is_call(op):
+        return [int_reg('_r3_'), float_reg('_f1_')]
+    elif is_update(op):
+        return op.registers()
+    elif op.opcode in ops.store_ops | ops.compare_ops | ops.branch_ops \
+                      | {'mtctr'}:
+        return []
+    elif len(op.operands) > 0 and op_sets_var(op, op.operands[0]):
+        return [op.operands[0]]
+    return op.registers()
+
+# a line whose address is only known once functions are laid out: a
+# 'branch', a switch table 'word' or the lis of a lis/addi 'load'
+# pair, pointing offset bytes past a symbol (None meaning the function
+# itself); branches keep their opcode and loads their register
+class Relocation:
+    __slots__ = ('line', 'kind', 'symbol', 'offset', 'opcode', 'reg')
+
+    def __init__(self, line, kind, symbol, offset, opcode=None, reg=None):
+        self.line = line
+        self.kind = kind
+        self.symbol = symbol
+        self.offset = offset
+        self.opcode = opcode
+        self.reg = reg
+
+# a function assembled as if it started at address 0, with relocations
+# to apply once it has a real address, and how often each peephole
+# rule fired on it
+class Blob:
+    __slots__ = ('name', 'asm', 'relocations', 'hits')
+
+    def __init__(self, name, asm, relocations, hits):
+        self.name = name
+        self.asm = asm
+        self.relocations = relocations
+        self.hits = hits
+
+# assembles a run of functions in a worker process
+def assemble_chunk(region, optimize, nodes):
+    assembler = Assembler(region, 0, [], optimize)
+    return [assembler.assemble_function(node) for node in nodes]
+
+# fewest functions worth handing to a worker process
+min_chunk_size = 16
+
+# what a line run counts for against a line of space, by what a build
+# is optimized for; used where there's more than one way to lower a
+# construct
+cost_weights = {'speed': (16, 1), 'size': (1, 16)}
+
+# lines run on average to find which of n cases a switch goes to by
+# comparing against each in turn, or halving them at each compare,
+# counting not finding any as one more outcome
+def compares_time(n):
+    return (n * (n + 1) + 2 * n + 1) / (n + 1)
+
+def compare_tree_time(n):
+    if n <= 3:
+        return compares_time(n)
+    middle = n // 2
+    upper = n - middle - 1
+    return 3 + (middle * compare_tree_time(middle)
+                + (upper + 1) * compare_tree_time(upper)) / (n + 1)
+
+# peephole rules look at the lines starting at i once registers are
+# assigned, and return how many of them to replace and with what, or
+# None if they don't apply
+class Window:
+    __slots__ = ('asm', 'bits', 'get_live', 'live', 'labels')
+
+    def __init__(self, asm, bits, get_live):
+        self.asm = asm
+        self.bits = bits
+        self.get_live = get_live
+        self.live = None
+        self.labels = {line.index: i for i, line in enumerate(asm)
+                       if type(line) is Label}
+
+    # the next count lines, unless a label splits them
+    def lines(self, i, count):
+        lines = self.asm[i:i+count]
+        if len(lines) < count or any(type(line) is Label for line in lines):
+            return None
+        return lines
+
+    # whether reg still holds a needed value after line i; liveness is
+    # only worked out once a rule asks
+    def is_live(self, i, reg):
+        if self.live is None:
+            self.live = self.get_live(self.asm)
+        return self.live[i] & self.bits.get(reg, 0) != 0
+
+    # first line run when branching to the label
+    def follow(self, label):
+        i = self.labels[label.index]
+        while i < len(self.asm) and type(self.asm[i]) is Label:
+            i += 1
+        return i
+
+# bits start through end, counting from the top; wraps around when
+# start comes after end
+def make_mask(start, end):
+    upper = 0xffffffff ^ ((1 << (31 - end)) - 1)
+    lower = (1 << (32 - start)) - 1
+    return upper & lower if start <= end else upper | lower
+
+def rotate_left(n, rot):
+    return (n << rot | n >> (32 - rot)) & 0xffffffff if rot else n
+
+# rlwinm and the shifts standing in for it, as (rotation, mask)
+def get_rotation(op):
+    if op.opcode == 'rlwinm':
+        _, _, rot, start, end = op.operands
+        if not all(type(n) is int and 0 <= n < 32
+                   for n in [rot, start, end]):
+            return None
+        return rot, make_mask(start, end)
+    elif op.opcode in ['slwi', 'srwi'] and 0 <= op.operands[2] < 32:
+        n = op.operands[2]
+        if op.opcode == 'slwi':
+            return n, make_mask(0, 31 - n)
+        return -n % 32, make_mask(n, 31)
+    return None
+
+def peep_self_move(window, i):
+    line = window.asm[i]
+    if is_move(line) and line.operands[0] == line.operands[1]:
+        return 1, []
+
+# nothing reaches the lines after a jump but through a label
+def peep_unreachable(window, i):
+    lines = window.lines(i, 2)
+    if lines and lines[0].opcode in ['b', 'bctr', 'blr']:
+        return 2, lines[:1]
+
+def peep_branch_to_next(window, i):
+    if (target := branch_target(window.asm[i])) is None:
+        return None
+    j = window.labels[target.index]
+    if j > i and all(type(line) is Label for line in window.asm[i+1:j]):
+        return 1, []
+
+# branching to a jump or return goes straight to where that one goes
+def peep_thread_branch(window, i):
+    line = window.asm[i]
+    if (target := branch_target(line)) is None:
+        return None
+    j = window.follow(target)
+    if j == len(window.asm):
+        return None
+    elif window.asm[j].opcode == 'blr' and line.opcode == 'b':
+        return 1, [Instr('blr')]
+    elif window.asm[j].opcode == 'b':
+        new_target = branch_target(window.asm[j])
+        if window.follow(new_target) != j:
+            return 1, [Instr(line.opcode, new_target)]
+
+# the flags still hold after branching on them
+def peep_repeated_compare(window, i):
+    lines = window.lines(i, 3)
+    if lines and lines[0].opcode in ops.compare_ops \
+       and is_branch(lines[1]) and lines[1].opcode not in ['b', 'bctr'] \
+       and lines[2].opcode == lines[0].opcode \
+       and lines[2].operands == lines[0].operands:
+        return 3, lines[:2]
+
+# an immediate only loaded to be added can be added directly
+def peep_add_immediate(window, i):
+    lines = window.lines(i, 2)
+    if not lines or lines[0].opcode != 'li' \
+       or lines[1].opcode not in ['add', 'sub']:
+        return None
+    reg, value = lines[0].operands
+    dest, left, right = lines[1].operands
+    if dest != reg and window.is_live(i + 1, reg):
+        return None
+    if lines[1].opcode == 'sub':
+        if right == reg and left not in [reg, 'r0'] and value != -0x8000:
+            return 2, [Instr('subi', dest, left, value)]
+    elif right == reg and left not in [reg, 'r0']:
+        return 2, [Instr('addi', dest, left, value)]
+    elif left == reg and right not in [reg, 'r0']:
+        return 2, [Instr('addi', dest, right, value)]
+
+# a copy only read by the next line can be read from where it came
+def peep_forward_move(window, i):
+    lines = window.lines(i, 2)
+    if not lines or not is_move(lines[0]) or is_update(lines[1]) \
+       or len(lines[1].operands) == 0:
+        return None
+    move, line = lines
+    dest, src = move.operands
+    if op_sets_var(line, line.operands[0]):
+        start = 1
+    elif line.opcode in ops.store_ops | ops.compare_ops | {'mtctr'}:
+        start = 0
+    else:
+        return None
+    if dest not in line.registers()[start:] \
+       or (src == 'r0' and dest in get_base_registers(line)) \
+       or ((start == 0 or line.operands[0] != dest)
+           and window.is_live(i + 1, dest)):
+        return None
+    operands = list(line.operands[:start])
+    for operand in line.operands[start:]:
+        if type(operand) is Mem and operand.base == dest:
+            operand = Mem(operand.offset, src)
+        elif operand == dest:
+            operand = src
+        operands.append(operand)
+    return 2, [Instr(line.opcode, *operands)]
+
+# a result only copied elsewhere can be put there directly
+def peep_move_result(window, i):
+    if i + 1 == len(window.asm) or not is_move(window.asm[i+1]) \
+       or is_update(window.asm[i]):
+        return None
+    line, move = window.asm[i:i+2]
+    dest, src = move.operands
+    if op_sets_var(line, src, False) and not window.is_live(i + 1, src):
+        return 2, [Instr(line.opcode, dest, *line.operands[1:])]
+
+# reading back what was just stored is a copy
+def peep_forward_store(window, i):
+    lines = window.lines(i, 2)
+    loads = {'stw': ('lwz', 'mr'), 'stfd': ('lfd', 'fmr')}
+    if not lines or lines[0].opcode not in loads:
+        return None
+    store, load = lines
+    opcode, move = loads[store.opcode]
+    if load.opcode != opcode:
+        return None
+    src, addr = store.operands
+    dest, load_addr = load.operands
+    if type(addr) is Mem and type(load_addr) is Mem \
+       and addr.offset == load_addr.offset and addr.base == load_addr.base:
+        return 2, [store] + ([] if dest == src else [Instr(move, dest, src)])
+
+# two rotate-and-masks in a row are one, as long as the mask they
+# add up to is contiguous
+def peep_merge_rotations(window, i):
+    lines = window.lines(i, 2)
+    if not lines or (first := get_rotation(lines[0])) is None \
+       or (second := get_rotation(lines[1])) is None:
+        return None
+    temp, src = lines[0].operands[:2]
+    dest = lines[1].operands[0]
+    if lines[1].operands[1] != temp \
+       or (dest != temp and window.is_live(i + 1, temp)):
+        return None
+    rot = (first[0] + second[0]) % 32
+    mask = rotate_left(first[1], second[0]) & second[1]
+    if mask == 0:
+        return 2, [Instr('li', dest, 0)]
+    elif mask == 0xffffffff:
+        return 2, [Instr('rlwinm', dest, src, rot, 0, 31)]
+    elif is_mask_contiguous(mask):
+        start, end = get_mask_bounds(mask)
+        return 2, [Instr('rlwinm', dest, src, rot, start, end)]
+
+# rotating by nothing under a full mask is a copy
+def peep_plain_rotation(window, i):
+    line = window.asm[i]
+    if get_rotation(line) == (0, 0xffffffff):
+        return 1, [Instr('mr', *line.operands[:2])]
+
+# adding nothing is a copy too
+def peep_add_zero(window, i):
+    line = window.asm[i]
+    if line.opcode in ['addi', 'subi'] and line.operands[2] == 0 \
+       and line.operands[1] != 'r0':
+        return 1, [Instr('mr', *line.operands[:2])]
+
+# tried in order at each line, by the opcodes they start at, until
+# none applies anywhere
+peephole_rules = [
+    ('self-move', {'mr', 'fmr'}, peep_self_move),
+    ('unreachable', {'b', 'bctr', 'blr'}, peep_unreachable),
+    ('branch-to-next', ops.branch_ops - {'bctr', 'bdnz'},
+     peep_branch_to_next),
+    ('thread-branch', ops.branch_ops - {'bctr'},
+     peep_thread_branch),
+    ('repeated-compare', ops.compare_ops, peep_repeated_compare),
+    ('add-immediate', {'li'}, peep_add_immediate),
+    ('forward-move', {'mr', 'fmr'}, peep_forward_move),
+    ('move-result', ops.load_ops | ops.math_ops | {'li', 'lis', 'fmr', 'mr'},
+     peep_move_result),
+    ('forward-store', {'stw', 'stfd'}, peep_forward_store),
+    ('merge-rotations', {'rlwinm', 'slwi', 'srwi'}, peep_merge_rotations),
+    ('plain-rotation', {'rlwinm', 'slwi', 'srwi'}, peep_plain_rotation),
+    ('add-zero', {'addi', 'subi'}, peep_add_zero),
+]
 
 class Assembler:
-    def __init__(self, region, addr, ast):
+    def __init__(self, region, addr, ast, optimize='speed'):
         self.region = region
         self.start_addr = addr
         self.syntax_tree = ast
+        self.optimize = optimize
 
-    def assemble(self):
+    # how often each peephole rule fired is kept in self.hits
+    def assemble(self, jobs=1):
         print('Assembling...')
-        asm = []
-        self.functions = {}
-        self.branch_idx = 0
-        for node in self.syntax_tree:
-            self.address = self.start_addr + 4 * len(asm)
-            asm += self._assemble_node(node)
-        # fill in function addresses
-        for i in range(len(asm)):
-            line = asm[i]
-            if (match := re.search(r'(@|&)([_0-9a-zA-Z]+)', line)):
-                name = match.group(2)
-                addr = 0
-                if name in self.functions:
-                    addr = self.functions[name]
-                elif name in globals_.functions[self.region]:
-                    addr = globals_.functions[self.region][name]
-                elif name.startswith('FUN_'):
-                    addr = int(name[4:], 16)
-                else:
-                    print('UNKNOWN:', name)
-                assert addr != 0
-                if match.group(1) == '@':
-                    asm[i] = line.replace(match.group(), hex(addr))
-                else:
-                    args = split_op(line)
-                    assert args[0] == 'lis'
-                    load = self._generate_load(addr)
-                    asm[i] = load[0].replace('@INT(_temp_)', args[1])
-                    asm[i+1] = load[1].replace('@INT(_temp_)', args[1])
+        blobs = self.assemble_functions(self.syntax_tree, jobs)
+        asm = self.link(blobs)
+        self.hits = {}
+        for blob in blobs:
+            for rule, count in blob.hits.items():
+                self.hits[rule] = self.hits.get(rule, 0) + count
         print('Done.')
         return asm
 
+    # functions don't depend on where they end up, so they can be
+    # assembled side by side and only laid out once all are done;
+    # jobs=None uses every core
+    def assemble_functions(self, nodes, jobs=1):
+        if jobs is None:
+            jobs = os.cpu_count() or 1
+        size = max(min_chunk_size, math.ceil(len(nodes) / (4 * jobs)))
+        chunks = [nodes[i:i+size] for i in range(0, len(nodes), size)]
+        if jobs > 1 and len(chunks) > 1:
+            with ProcessPoolExecutor(min(jobs, len(chunks))) as pool:
+                results = pool.map(assemble_chunk, [self.region] * len(chunks),
+                                   [self.optimize] * len(chunks), chunks)
+                return [blob for blobs in results for blob in blobs]
+        return [self.assemble_function(node) for node in nodes]
+
+    # the result only depends on the node, so it can be reused for
+    # as long as the function is unchanged
+    def assemble_function(self, node):
+        assert type(node) is Function
+        self.branch_idx = 0
+        self.peephole_hits = {}
+        asm, relocations = self._assemble_def(fold_function(node))
+        return Blob(node.name, asm, relocations, self.peephole_hits)
+
+    def link(self, blobs):
+        self.functions = {}
+        address = self.start_addr
+        for blob in blobs:
+            assert blob.name not in self.functions
+            self.functions[blob.name] = address
+            address += 4 * len(blob.asm)
+        # everything a relocation can refer to by name; the script's own
+        # functions win over the game's
+        self.symbols = dict(globals_.functions[self.region])
+        self.symbols.update(self.functions)
+        asm = []
+        for blob in blobs:
+            asm += self.relocate(blob)
+        return asm
+
+    def relocate(self, blob):
+        base = self.functions[blob.name]
+        asm = blob.asm[:]
+        for reloc in blob.relocations:
+            i = reloc.line
+            addr = reloc.offset + (base if reloc.symbol is None
+                                   else self.resolve(reloc.symbol))
+            if reloc.kind == 'branch':
+                asm[i] = f'{reloc.opcode} {hex(addr)}'
+            elif reloc.kind == 'word':
+                asm[i] = hex(addr)
+            elif reloc.kind == 'load':
+                asm[i:i+2] = self._generate_address_load(addr, reloc.reg)
+        return asm
+
+    def resolve(self, name):
+        if name not in self.symbols:
+            addr = 0
+            if name.startswith('FUN_'):
+                addr = int(name[4:], 16)
+            else:
+                print('UNKNOWN:', name)
+            assert addr != 0
+            self.symbols[name] = addr
+        return self.symbols[name]
+
     def _assemble_node(self, node):
-        if type(node) is Function:
-            assert node.name not in self.functions
-            self.functions[node.name] = self.address
-            return self._assemble_def(node)
-        elif type(node) is Call:
+        if type(node) is Call:
             return self._assemble_call(node)
         elif type(node) is Set:
             if node.type == 'float':
@@ -145,9 +521,9 @@ class Assembler:
                                           'size': node.size}
             return []
         elif node[0] == 'break':
-            return [f'b @BRANCH({self.break_idx})']
+            return [Instr('b', Label(self.break_idx))]
         elif node[0] == 'continue':
-            return [f'b @BRANCH({self.continue_idx})']
+            return [Instr('b', Label(self.continue_idx))]
         raise Exception(f"UNHANDLED NODE: '{node}'")
 
     def _assemble_def(self, node):
@@ -157,10 +533,12 @@ class Assembler:
         float_idx = 1
         for param in node.params:
             if param.type == 'float':
-                asm.append(f'fmr @FLOAT({param}), @FLOAT(_f{float_idx}_)')
+                asm.append(Instr('fmr', float_reg(param),
+                                 float_reg(f'_f{float_idx}_')))
                 float_idx += 1
             else:
-                asm.append(f'mr @INT({param}), @INT(_r{int_idx}_)')
+                asm.append(Instr('mr', int_reg(param),
+                                 int_reg(f'_r{int_idx}_')))
                 int_idx += 1
         self.arrays = {}
         self.switches = []
@@ -169,108 +547,788 @@ class Assembler:
             asm += self._assemble_node(subnode)
         if node.return_:
             if node.return_.type == 'float':
-                asm.append(f'fmr @FLOAT(_f1_), @FLOAT({node.return_})')
+                asm.append(Instr('fmr', float_reg('_f1_'),
+                                 float_reg(node.return_)))
             else:
-                asm.append(f'mr @INT(_r3_), @INT({node.return_})')
+                asm.append(Instr('mr', int_reg('_r3_'),
+                                 int_reg(node.return_)))
+
+        asm = self._hoist_invariants(asm)
+        asm = self._reduce_induction_variables(asm)
+        asm = self._number_values(asm)
+        asm = self._remove_dead_code(asm)
 
-        # allocate registers
+        # allocate registers; with no calls, nothing is persistent, and
+        # temps can go on to the registers calls preserve once the
+        # others run out
+        calls = any(is_call(line) for line in asm)
         asm, num_ints, num_floats = self._alloc_persistent_registers(asm)
-        asm = self._alloc_temp_registers(asm)
+        asm = self._alloc_temp_registers(asm, not calls)
         asm = self._remove_redundancies(asm)
+        if not calls:
+            num_ints, num_floats = self._count_saved_registers(asm)
 
         # stack frames + return
-        calls = any(is_call(line) for line in asm)
         arrays_size = sum(arr['size'] for arr in self.arrays.values())
         push, pop = self._make_stack_frame_commands(num_ints, num_floats,
                                                     arrays_size, calls,
                                                     self.casts)
         asm = push + asm + pop
-        asm.append('blr')
+        asm.append(Instr('blr'))
 
         # set array addresses
-        pattern = r'@ARRAY\(([_0-9a-zA-Z]+)(\[([0-9]+)\])*\)'
+        offsets = {}
+        offset = 0x10 if self.casts else 8
+        for arr in self.arrays:
+            offsets[arr] = offset
+            offset += 4 * self.arrays[arr]['size']
         for i in range(len(asm)):
-            line = asm[i]
-            offset = 0x10 if self.casts else 8
-            if (match := re.search(pattern, line)):
-                array = match.group(1)
-                for arr in self.arrays:
-                    if arr == array:
-                        break
-                    offset += 4 * self.arrays[arr]['size']
-                if match.group(3):
-                    offset += 4 * int(match.group(3))
-                asm[i] = re.sub(pattern, hex(offset), line)
+            operands = []
+            for operand in asm[i].operands:
+                if type(operand) is Mem and type(operand.offset) is ArraySlot:
+                    slot = operand.offset
+                    operand = Mem(offsets[slot.name] + 4 * (slot.index or 0),
+                                  operand.base)
+                elif type(operand) is ArraySlot:
+                    operand = offsets[operand.name] + 4 * (operand.index or 0)
+                operands.append(operand)
+            if operands != list(asm[i].operands):
+                asm[i] = Instr(asm[i].opcode, *operands)
+
+        asm = self._run_peephole(asm)
 
-        # set branch addresses
-        address = self.functions[node.name]
+        # set branch offsets
         branches = {}
         for i in range(len(asm)):
-            if (match := re.match(branch_pattern, asm[i])):
-                branch_idx = int(match.group(1))
-                branches[branch_idx] = address + 4 * (i - len(branches))
-        for i in range(len(asm) - 1, -1, -1):
-            line = asm[i]
+            if type(asm[i]) is Label:
+                branches[asm[i].index] = 4 * (i - len(branches))
+        # write out as text
+        relocations = []
+        references = []
+        tables = []
+        lines = []
+        for line in asm:
+            target = line.operands[-1] if len(line.operands) > 0 else None
             # remove branch labels
-            if re.match(branch_pattern, line):
-                asm.pop(i)
+            if type(line) is Label:
+                continue
             # fill placeholders
-            elif (match := re.search(branch_pattern, line)):
-                branch_idx = int(match.group(1))
-                addr = branches[branch_idx]
-                asm[i] = re.sub(branch_pattern, hex(addr), line)
-            # strip @SWITCH tag from bctrs
-            elif split_op(line)[0] == 'bctr':
-                asm[i] = 'bctr'
+            elif type(target) is Label:
+                offset = branches[target.index]
+                relocations.append(Relocation(len(lines), 'branch', None,
+                                              offset, opcode=line.opcode))
+                line = f'{line.opcode} {hex(offset)}'
+            # strip switch table from bctrs
+            elif line.opcode == 'bctr':
+                line = 'bctr'
+            else:
+                if type(target) is SwitchTable and line.opcode == 'lis':
+                    tables.append((len(lines), line.operands[0], target.index))
+                elif type(target) is Symbol:
+                    references.append(Relocation(len(lines), 'branch',
+                                                 target.name, 0,
+                                                 opcode=line.opcode))
+                elif type(target) is Address and line.opcode == 'lis':
+                    references.append(Relocation(len(lines), 'load',
+                                                 target.name, 0,
+                                                 reg=line.operands[0]))
+                line = str(line)
+            lines.append(line)
+        asm = lines
 
         # build switch tables
-        for i in range(len(asm)):
-            if (match := re.search(r'@SWITCH_TABLE\(([0-9]+)\)', asm[i])):
-                # update table address load
-                table_addr = address + 4 * len(asm)
-                reg = split_op(asm[i])[1]
-                load = self._generate_load(table_addr)
-                asm[i] = load[0].replace('@INT(_temp_)', reg)
-                asm[i+1] = load[1].replace('@INT(_temp_)', reg)
-                # make switch table
-                idx = int(match.group(1))
-                switch = self.switches[idx]
-                for case in range(max(switch['cases']) + 1):
-                    if case in switch['cases']:
-                        branch_idx = switch['cases'][case]
-                    else:
-                        branch_idx = switch['default']
-                    asm.append(hex(branches[branch_idx]))
+        for i, reg, idx in tables:
+            # update table address load
+            offset = 4 * len(asm)
+            relocations.append(Relocation(i, 'load', None, offset, reg=reg))
+            asm[i:i+2] = self._generate_address_load(offset, reg)
+            # make switch table
+            switch = self.switches[idx]
+            for case in range(switch['low'], max(switch['cases']) + 1):
+                if case in switch['cases']:
+                    branch_idx = switch['cases'][case]
+                else:
+                    branch_idx = switch['default']
+                relocations.append(Relocation(len(asm), 'word', None,
+                                              branches[branch_idx]))
+                asm.append(hex(branches[branch_idx]))
+
+        # function references
+        relocations += references
+
+        return asm, relocations
+
+    # loop-invariant code motion: pure operations in a loop whose operands
+    # don't change in it are done once before the loop, into a register
+    # the loop copies from
+    def _hoist_invariants(self, asm):
+        self.hoists = 0
+        for header in self._get_loop_headers(asm):
+            asm = self._hoist_loop_invariants(asm, header)
+        return asm
+
+    def _hoist_loop_invariants(self, asm, header):
+        if (bounds := self._get_loop_bounds(asm, header)) is None:
+            return asm
+        start, end = bounds
+        targets = self._get_jump_targets(asm)
+        changed = set()
+        for line in asm[start:end+1]:
+            changed.update(get_changed_registers(line))
+        spare = self._get_spare_registers(asm, start, end)
+        hoisted = []
+        body = []
+        mapped = {}  # register -> what it was copied from, while it holds
+        i = start
+        while i <= end:
+            line = asm[i]
+            count = self._get_invariant_length(asm, i, end, changed, mapped)
+            if count == 0 or spare[line.operands[0].type] == 0:
+                if type(line) is Label and line.index in targets:
+                    mapped = {}
+                for reg in get_changed_registers(line):
+                    mapped.pop(reg, None)
+                body.append(line)
+                i += 1
+                continue
+            dest = line.operands[0]
+            spare[dest.type] -= 1
+            # set once in front of the loop and read on every pass, so
+            # it is named like a variable to keep it in a register
+            # calls in the loop don't clobber
+            reg = VReg(f'.hoist{self.hoists}', dest.type)
+            self.hoists += 1
+            for line in asm[i:i+count]:
+                hoisted.append(Instr(line.opcode, reg, *[
+                    mapped.get(operand, operand)
+                    for operand in line.operands[1:]]))
+                mapped[dest] = reg
+            body.append(Instr('fmr' if dest.type == 'float' else 'mr',
+                              dest, reg))
+            i += count
+        return asm[:start] + hoisted + body + asm[end+1:]
+
+    # how many lines starting at i compute something the loop ending at
+    # end doesn't change, or 0
+    def _get_invariant_length(self, asm, i, end, changed, mapped):
+        line = asm[i]
+        if line.opcode not in pure_ops or type(line.operands[0]) is not VReg:
+            return 0
+        dest = line.operands[0]
+        # addresses are loaded in lis/addi pairs
+        if type(line.operands[-1]) in [Address, SwitchTable]:
+            if line.opcode == 'lis' and i < end \
+               and asm[i+1].opcode == 'addi' \
+               and asm[i+1].operands[:2] == (dest, dest) \
+               and type(asm[i+1].operands[2]) is type(line.operands[1]):
+                return 2
+            return 0
+        for operand in line.operands[1:]:
+            if type(operand) is VReg:
+                if operand not in mapped and (operand in changed
+                   or re.fullmatch(precolored_pattern, operand.name)):
+                    return 0
+            elif type(operand) not in [int, str, ArraySlot]:
+                return 0
+        return 1
+
+    # strength reduction: values in a loop that move in step with a
+    # counter, like base + i * 0x14, get a register of their own that's
+    # bumped whenever the counter is, rather than being multiplied out
+    # again each time around. where the loop reads memory through such
+    # a value once per pass, the bump is folded into an update load or
+    # store instead
+    def _reduce_induction_variables(self, asm):
+        self.steps = 0
+        for header in self._get_loop_headers(asm):
+            asm = self._reduce_loop(asm, header)
+        return asm
+
+    def _reduce_loop(self, asm, header):
+        if (bounds := self._get_loop_bounds(asm, header)) is None:
+            return asm
+        start, end = bounds
+        counters = self._find_counters(asm, start, end)
+        if len(counters) == 0:
+            return asm
+        effects = self._get_line_effects(asm)
+        bits, live = self._get_live_after(asm, effects)
+        targets = self._get_jump_targets(asm)
+        records, needed = self._find_derived_values(asm, start, end, counters,
+                                                    effects, bits, live,
+                                                    targets)
+        # lines computing the same value share a register; values that
+        # only add to the counter are as cheap to work out as to bump
+        groups = {}
+        for i in sorted(needed):
+            if records[i][1] != 1:
+                groups.setdefault(records[i], []).append(i)
+        spare = self._get_spare_registers(asm, start, end)
+        inits = []
+        replaced = {}
+        bumps = {}
+        for (counter, scale, base, offset), lines in groups.items():
+            steps = {i: to_signed(scale * step)
+                     for i, step in counters[counter].items()}
+            if spare['int'] == 0 or not fits_immediate(scale) \
+               or not all(fits_immediate(step) for step in steps.values()):
+                continue
+            access = None
+            if len(lines) == 1 and len(steps) == 1:
+                access = self._find_update_access(asm, start, end, lines[0],
+                                                  *steps.items(), bits, live,
+                                                  targets)
+            if access is not None:
+                offset = to_signed(offset + access[1])
+            if not fits_immediate(offset):
+                continue
+            spare['int'] -= 1
+            # stepped with the counter on every pass, past any calls
+            reg = int_reg(f'.step{self.steps}')
+            self.steps += 1
+            inits += self._init_derived_value(asm, start, reg, counter, scale,
+                                              base, offset)
+            if access is not None:
+                for i, (opcode, operand, disp) in access[0].items():
+                    replaced[i] = [Instr(opcode, operand, Mem(disp, reg))]
+                replaced[lines[0]] = []
+                continue
+            for i, step in steps.items():
+                bumps.setdefault(i, []).append(Instr('addi', reg, reg, step))
+            for i in lines:
+                replaced[i] = [Instr('mr', asm[i].operands[0], reg)]
+        if len(inits) == 0:
+            return asm
+        body = []
+        for i in range(start, end + 1):
+            body += replaced.get(i, [asm[i]]) + bumps.get(i, [])
+        return asm[:start] + inits + body + asm[end+1:]
+
+    # counter * scale + base + offset, worked out ahead of the loop
+    # starting at start. a counter that starts off at a known value, as
+    # loop indices do, needn't be multiplied
+    def _init_derived_value(self, asm, start, reg, counter, scale, base,
+                            offset):
+        first = None
+        for line in reversed(asm[:start]):
+            if type(line) is Label or is_branch(line) or is_call(line):
+                break
+            elif counter in get_changed_registers(line):
+                if line.opcode == 'li' and type(line.operands[1]) is int:
+                    first = to_signed(line.operands[1] * scale + offset)
+                break
+        if first is not None and fits_immediate(first):
+            if base is None:
+                return [Instr('li', reg, first)]
+            elif first == 0:
+                return [Instr('mr', reg, base)]
+            return [Instr('addi', reg, base, first)]
+        inits = [Instr('mulli', reg, counter, scale)]
+        if base is not None:
+            inits.append(Instr('add', reg, reg, base))
+        if offset != 0:
+            inits.append(Instr('addi', reg, reg, offset))
+        return inits
+
+    # registers the loop only ever changes by adding a constant to them,
+    # with the amount added at each line that does
+    def _find_counters(self, asm, start, end):
+        counters = {}
+        changed = set()
+        for i in range(start, end + 1):
+            line = asm[i]
+            for reg in get_changed_registers(line):
+                if line.opcode in ['addi', 'subi'] \
+                   and line.operands[:2] == (reg, reg) \
+                   and type(line.operands[2]) is int and reg not in changed \
+                   and not re.fullmatch(precolored_pattern, reg.name):
+                    step = line.operands[2]
+                    counters.setdefault(reg, {})[i] = \
+                        step if line.opcode == 'addi' else -step
+                else:
+                    changed.add(reg)
+                    counters.pop(reg, None)
+        return counters
+
+    # values computed in the loop as counter * scale + base + offset,
+    # by line, and the lines whose value is read by something other
+    # than another such computation
+    def _find_derived_values(self, asm, start, end, counters, effects, bits,
+                             live, targets):
+        changed = set()
+        for line in asm[start:end+1]:
+            changed.update(get_changed_registers(line))
+        records = {}
+        needed = set()
+        state = {}       # register -> line whose value it holds
+        invariants = {}  # register -> the invariant register it copies
+
+        def value(reg):
+            if reg in state:
+                return records[state[reg]]
+            elif reg in counters:
+                return (reg, 1, None, 0)
+            return None
+
+        def invariant(reg):
+            if reg in invariants:
+                return invariants[reg]
+            elif type(reg) is VReg and reg not in changed \
+                 and not re.fullmatch(precolored_pattern, reg.name):
+                return reg
+            return None
+
+        # values still around when they can't be followed anymore might
+        # be read later on
+        def forget(regs, i):
+            for reg in regs:
+                if live[i] & bits.get(reg, 0):
+                    needed.add(state[reg])
+                del state[reg]
+
+        for i in range(start, end + 1):
+            line = asm[i]
+            if type(line) is Label:
+                if line.index in targets:
+                    forget(list(state), i)
+                    invariants = {}
+                continue
+            record = self._get_derived_record(line, value, invariant, counters)
+            if record is None:
+                for reg in effects[i][0]:
+                    if reg in state:
+                        needed.add(state[reg])
+            for reg in get_changed_registers(line):
+                state.pop(reg, None)
+                invariants.pop(reg, None)
+                if reg in counters:
+                    forget([other for other, j in state.items()
+                            if records[j][0] == reg], i)
+            if record is not None:
+                records[i] = record
+                state[line.operands[0]] = i
+            elif is_move(line) and (src := invariant(line.operands[1])):
+                invariants[line.operands[0]] = src
+        forget(list(state), end)
+        return records, needed
+
+    # what a line computes as (counter, scale, base, offset), if it
+    # follows from a counter
+    def _get_derived_record(self, line, value, invariant, counters):
+        if line.opcode not in pure_ops | {'mr'} \
+           or type(line.operands[0]) is not VReg \
+           or line.operands[0] in counters \
+           or re.fullmatch(precolored_pattern, line.operands[0].name):
+            return None
+        opcode, operands = line.opcode, line.operands[1:]
+        if opcode == 'mr':
+            return value(operands[0])
+        elif opcode in ['addi', 'subi'] and type(operands[1]) is int:
+            if (record := value(operands[0])) is None:
+                return None
+            counter, scale, base, offset = record
+            step = operands[1] if opcode == 'addi' else -operands[1]
+            return (counter, scale, base, to_signed(offset + step))
+        elif opcode == 'add':
+            for left, right in [operands, operands[::-1]]:
+                record = value(left)
+                if record is not None and record[2] is None \
+                   and (base := invariant(right)) is not None:
+                    return (record[0], record[1], base, record[3])
+            return None
+        # multiplying; shifts left count as multiplying by a power of two
+        if opcode == 'mulli':
+            factor = operands[1]
+        elif (rotation := get_rotation(line)) is not None \
+             and rotation[0] > 0 \
+             and rotation[1] == make_mask(0, 31 - rotation[0]):
+            factor = 1 << rotation[0]
+        else:
+            return None
+        record = value(operands[0])
+        if record is None or record[2] is not None:
+            return None
+        counter, scale, _, offset = record
+        return (counter, to_signed(scale * factor), None,
+                to_signed(offset * factor))
+
+    # when the only thing the value computed at line is used for is as
+    # the address of loads and stores right after it, and the counter
+    # is stepped once per pass after them, the first access can bump the
+    # register itself. returns the (opcode, operand, offset) of each
+    # access by line, the first one in its update form and the rest
+    # relative to it, and how far the register starts off from the value
+    def _find_update_access(self, asm, start, end, line, bump, bits, live,
+                            targets):
+        counter_line, step = bump
+        # both need to happen exactly once each time around, so nothing
+        # may jump back to before the access without passing the counter
+        labels = {asm[i].index: i for i in range(start, end + 1)
+                  if type(asm[i]) is Label}
+        for i in range(start + 1, counter_line):
+            if type(asm[i]) is Label and i < line:
+                return None
+            elif is_branch(asm[i]):
+                if (target := branch_target(asm[i])) is None:
+                    return None
+                j = labels.get(target.index)
+                if j is not None and (i < line or j <= i):
+                    return None
+        for i in range(counter_line + 1, end):
+            if is_branch(asm[i]) \
+               or (type(asm[i]) is Label and asm[i].index in targets):
+                return None
+        reg = asm[line].operands[0]
+        accesses = {}
+        first = None
+        for i in range(line + 1, counter_line + 1):
+            current = asm[i]
+            if type(current) is Label or is_branch(current) \
+               or is_call(current) or i == counter_line:
+                # it mustn't be needed past here
+                if live[i - 1] & bits.get(reg, 0):
+                    return None
+                break
+            if reg in self._get_operands(current)[0]:
+                if current.opcode not in ops.load_ops | ops.store_ops \
+                   or is_update(current) or current.opcode[-1] == 'x' \
+                   or type(current.operands[1]) is not Mem \
+                   or current.operands[1].base != reg \
+                   or type(current.operands[1].offset) is not int \
+                   or (current.opcode in ops.store_ops
+                       and current.operands[0] == reg):
+                    return None
+                offset = current.operands[1].offset
+                if first is None:
+                    if current.opcode + 'u' not in ops.load_ops | ops.store_ops:
+                        return None
+                    first = offset
+                    accesses[i] = (current.opcode + 'u', current.operands[0],
+                                   step)
+                elif fits_immediate(offset - first):
+                    accesses[i] = (current.opcode, current.operands[0],
+                                   offset - first)
+                else:
+                    return None
+            if reg in get_changed_registers(current):
+                break
+        if first is None:
+            return None
+        return accesses, first - step
+
+    # how many more values of each kind could be kept in registers through
+    # the lines from start to end. with a call among them, that means the
+    # registers calls don't clobber
+    def _get_spare_registers(self, asm, start, end):
+        if any(is_call(line) for line in asm[start:end+1]):
+            variables = self._find_persistent_variables(asm)
+            return {kind: 18 - list(variables.values()).count(kind)
+                    for kind in ['int', 'float']}
+        effects = self._get_line_effects(asm)
+        bits, live = self._get_live_after(asm, effects)
+        masks = {'int': 0, 'float': 0}
+        for reg, bit in bits.items():
+            masks[reg.type] |= bit
+        pressure = {'int': 0, 'float': 0}
+        for i in range(start, end + 1):
+            read, written = effects[i]
+            before = live[i]
+            for reg in written:
+                before &= ~bits[reg]
+            for reg in read:
+                before |= bits[reg]
+            for kind in pressure:
+                pressure[kind] = max(pressure[kind],
+                                     (before & masks[kind]).bit_count())
+        return {kind: max(len(temp_registers[kind]) - pressure[kind], 0)
+                for kind in pressure}
+
+    # labels of the loops in a function, found by their backward branches
+    def _get_loop_headers(self, asm):
+        labels = {line.index: i for i, line in enumerate(asm)
+                  if type(line) is Label}
+        headers = []
+        for i, line in enumerate(asm):
+            target = branch_target(line)
+            if target is not None and labels[target.index] <= i \
+               and target.index not in headers:
+                headers.append(target.index)
+        return headers
+
+    # first and last line of the loop at a header, or None if there's a
+    # way into it other than through the top, as then code put in front
+    # of the loop wouldn't always run before it
+    def _get_loop_bounds(self, asm, header):
+        start = next(i for i, line in enumerate(asm)
+                     if type(line) is Label and line.index == header)
+        end = max(i for i, line in enumerate(asm)
+                  if (target := branch_target(line)) is not None
+                  and target.index == header)
+        inside = {line.index for line in asm[start:end+1]
+                  if type(line) is Label}
+        for i, line in enumerate(asm):
+            if not start <= i <= end and (target := branch_target(line)) \
+               and target.index in inside:
+                return None
+        return start, end
+
+    # a bit for each virtual register, and the bitset of those live
+    # after each line
+    def _get_live_after(self, asm, effects):
+        cfg, ranges, bits, live_out = self._get_block_liveness(asm, effects)
+        live = [0] * len(asm)
+        for node in cfg:
+            bitset = live_out[node]
+            for i in reversed(ranges[node]):
+                live[i] = bitset
+                read, written = effects[i]
+                for reg in written:
+                    bitset &= ~bits[reg]
+                for reg in read:
+                    bitset |= bits[reg]
+        return bits, live
+
+    # indices of the labels that are branched to, switch cases included
+    def _get_jump_targets(self, asm):
+        targets = {target.index for line in asm
+                   if (target := branch_target(line)) is not None}
+        for switch in self.switches:
+            targets.update(switch['cases'].values())
+            targets.add(switch['default'])
+        return targets
+
+    # local value numbering: going down code that can only be entered at
+    # the top, an operation already done on the same values is replaced
+    # by a copy of a register still holding the result, or dropped if
+    # it's already in its destination. temps aren't kept across calls,
+    # since only named variables get registers calls don't clobber
+    def _number_values(self, asm):
+        values = {}   # operation -> value number
+        numbers = {}  # register -> number of the value it holds
+        holders = {}  # value number -> registers holding it, oldest first
+        count = 0
+
+        def number(reg):
+            nonlocal count
+            if reg not in numbers:
+                hold(reg, count)
+                count += 1
+            return numbers[reg]
+
+        def forget(reg):
+            if reg in numbers:
+                del holders[numbers.pop(reg)][reg]
+
+        def hold(reg, value):
+            forget(reg)
+            numbers[reg] = value
+            holders.setdefault(value, {})[reg] = None
 
+        # labels nothing branches to are only reached from above
+        targets = self._get_jump_targets(asm)
+        new_asm = []
+        for line in asm:
+            if (type(line) is Label and line.index in targets) \
+               or is_call(line):
+                values, numbers, holders = {}, {}, {}
+                new_asm.append(line)
+                continue
+            key = self._get_value_key(line, number)
+            if key is not None:
+                dest = line.operands[0]
+                fixed = re.fullmatch(precolored_pattern, dest.name)
+                if key not in values:
+                    values[key] = count
+                    count += 1
+                value = values[key]
+                srcs = [reg for reg in holders.get(value, {}) if reg != dest]
+                if numbers.get(dest) == value and not fixed:
+                    continue
+                # one-line constants are as cheap to redo as to copy
+                elif srcs and line.opcode not in ['li', 'lis']:
+                    src = srcs[0]
+                    line = Instr('fmr' if dest.type == 'float' else 'mr',
+                                 dest, src)
+                hold(dest, value)
+            elif is_move(line) \
+                 and all(type(reg) is VReg for reg in line.operands):
+                dest, src = line.operands
+                fixed = re.fullmatch(precolored_pattern, dest.name)
+                value = number(src)
+                if numbers.get(dest) == value and not fixed:
+                    continue
+                hold(dest, value)
+            else:
+                for reg in get_changed_registers(line):
+                    forget(reg)
+            new_asm.append(line)
+        return new_asm
+
+    # what a pure operation computes, in terms of the value numbers of
+    # what it reads, or None for anything else
+    def _get_value_key(self, line, number):
+        if line.opcode not in pure_ops or type(line.operands[0]) is not VReg:
+            return None
+        operands = []
+        for operand in line.operands[1:]:
+            if type(operand) is VReg:
+                operands.append(number(operand))
+            elif type(operand) in [int, str]:
+                operands.append(operand)
+            else:
+                return None
+        if line.opcode in commutative_ops \
+           and all(type(operand) is int for operand in operands):
+            operands.sort()
+        return (line.opcode, *operands)
+
+    # drops pure operations and copies whose results are never read;
+    # precolored registers are left alone, as calls and returns read them
+    def _remove_dead_code(self, asm):
+        while len(asm) > 0:
+            effects = self._get_line_effects(asm)
+            cfg, ranges, bits, live_out = self._get_block_liveness(asm,
+                                                                   effects)
+            dead = set()
+            for node in cfg:
+                live = live_out[node]
+                for i in reversed(ranges[node]):
+                    read, written = effects[i]
+                    if self._is_removable(asm[i]) \
+                       and not live & bits[written[0]]:
+                        dead.add(i)
+                        continue
+                    for reg in written:
+                        live &= ~bits[reg]
+                    for reg in read:
+                        live |= bits[reg]
+            if len(dead) == 0:
+                dead = self._find_unread_counters(asm, effects)
+            if len(dead) == 0:
+                break
+            asm = [line for i, line in enumerate(asm) if i not in dead]
         return asm
 
+    # a register that only ever feeds itself, like a loop counter left
+    # over from strength reduction, stays live through its own steps
+    def _find_unread_counters(self, asm, effects):
+        readers = {}
+        for i, (read, _) in enumerate(effects):
+            for reg in read:
+                readers.setdefault(reg, set()).add(i)
+        dead = set()
+        for reg, lines in readers.items():
+            if all(self._is_removable(asm[i]) and effects[i][1] == [reg]
+                   for i in lines):
+                dead |= lines
+        return dead
+
+    def _is_removable(self, line):
+        if line.opcode not in pure_ops | {'mr', 'fmr'} \
+           or type(line.operands[0]) is not VReg \
+           or re.fullmatch(precolored_pattern, line.operands[0].name):
+            return False
+        # lis/addi address pairs go together
+        return all(type(operand) in [VReg, int, str]
+                   for operand in line.operands)
+
     def _remove_redundancies(self, asm):
-        asm = asm[:]
         # remove redundant moves
-        for i in range(len(asm) - 1, -1, -1):
-            args = split_op(asm[i])
-            if is_move(asm[i]) and args[1] == args[2]:
-                asm.pop(i)
+        asm = [line for line in asm
+               if not (is_move(line) and line.operands[0] == line.operands[1])]
         # remove unnecessary param moves at start
         state = {}
-        redundant = []
+        redundant = set()
         for i in range(len(asm)):
             line = asm[i]
             if is_move(line):
-                args = split_op(line)
-                if args[2] in state and state[args[2]] == args[1]:
-                    redundant.append(i)
+                dest, src = line.operands
+                if src in state and state[src] == dest:
+                    redundant.add(i)
                 else:
-                    state[args[1]] = args[2]
+                    state[dest] = src
             elif is_call(line) or is_branch(line):
                 break
             else:
                 state = {k:v for k,v in state.items()
                          if not op_sets_var(line, v)
                          and not op_sets_var(line, k)}
-        for i in redundant[::-1]:
-            asm.pop(i)
-        return asm
+        return [line for i,line in enumerate(asm) if i not in redundant]
+
+    # applies the peephole rules over the whole function until none
+    # applies anymore, counting hits per rule
+    def _run_peephole(self, asm):
+        rules = {}
+        for rule, opcodes, peep in peephole_rules:
+            for opcode in opcodes:
+                rules.setdefault(opcode, []).append((rule, peep))
+        # rules never bring in new registers, so they can be numbered
+        # once, and lines kept from one pass to the next keep what they
+        # read and write
+        bits = {}
+        for line in asm:
+            for reg in line.registers():
+                if reg not in bits:
+                    bits[reg] = 1 << len(bits)
+        effects = {}
+        get_live = lambda asm: self._get_live_registers(asm, bits, effects)
+        while True:
+            window = Window(asm, bits, get_live)
+            new_asm = []
+            changed = False
+            i = 0
+            while i < len(asm):
+                for rule, peep in rules.get(asm[i].opcode, []):
+                    if (result := peep(window, i)) is not None:
+                        count, lines = result
+                        new_asm += lines
+                        i += count
+                        changed = True
+                        self.peephole_hits[rule] = \
+                            self.peephole_hits.get(rule, 0) + 1
+                        break
+                else:
+                    new_asm.append(asm[i])
+                    i += 1
+            if not changed:
+                return asm
+            asm = new_asm
+
+    # registers live after each line once they're assigned, as bitsets;
+    # calls and returns are taken to read every register and write none
+    def _get_live_registers(self, asm, bits, effects):
+        blocks = self._make_basic_blocks(asm)
+        cfg = self._make_control_flow_graph(blocks)
+        for line in asm:
+            if line in effects:
+                continue
+            elif is_call(line) or line.opcode == 'blr':
+                effects[line] = ((1 << len(bits)) - 1, 0)
+            else:
+                effects[line] = self._get_uses_and_defs(line, bits)
+        ranges = {}
+        start = 0
+        for node, block in zip(cfg, blocks):
+            ranges[node] = range(start, start + len(block))
+            start += len(block)
+        uses = {}
+        defs = {}
+        for node in cfg:
+            uses[node] = 0
+            defs[node] = 0
+            for i in ranges[node]:
+                read, written = effects[asm[i]]
+                uses[node] |= read & ~defs[node]
+                defs[node] |= written
+        live_out = self._solve_liveness(cfg, uses, defs)
+        live = [0] * len(asm)
+        for node in cfg:
+            bitset = live_out[node]
+            for i in reversed(ranges[node]):
+                live[i] = bitset
+                read, written = effects[asm[i]]
+                bitset = read | (bitset & ~written)
+        return live
 
     def _make_stack_frame_commands(self, num_ints, num_floats,
                                    arrays_size, makes_call, makes_cast):
@@ -282,319 +1340,599 @@ class Assembler:
             count = num_ints + (num_floats * 4) + arrays_size \
                     + (2 if makes_cast else 0) + 2
             size = (count + 3) // 4 * 0x10
-            # push stack frame
-            push += [f'stwu r1, -{hex(size)}(r1)',
-                     'mflr r0',
-                     f'stw r0, {hex(size + 4)}(r1)']
+            # push stack frame; leaf functions leave lr alone
+            push.append(Instr('stwu', 'r1', Mem(-size, 'r1')))
+            if makes_call:
+                push += [Instr('mflr', 'r0'),
+                         Instr('stw', 'r0', Mem(size + 4, 'r1'))]
             for i in range(num_floats):
                 offset = size - 0x10 * (i + 1)
-                push += [f'stfd f{31 - i}, {hex(offset)}(r1)',
-                         f'psq_st p{31 - i}, {hex(offset + 8)}(r1), 0, qr0']
-            if num_ints > 0:
-                offset = size - 0x10 * num_floats
-                push += [f'addi r11, r1, {hex(offset)}',
-                         f'bl @FUN_{0x801cbd78 - 4 * num_ints:08x}']
+                push += [Instr('stfd', f'f{31 - i}', Mem(offset, 'r1')),
+                         Instr('psq_st', f'p{31 - i}', Mem(offset + 8, 'r1'),
+                               '0', 'qr0')]
+            offset = size - 0x10 * num_floats
+            if num_ints > 0 and makes_call:
+                push += [Instr('addi', 'r11', 'r1', offset),
+                         Instr('bl', Symbol(f'FUN_{0x801cbd78 - 4 * num_ints:08x}'))]
+            else:
+                # calling the helpers would take saving lr
+                push += [Instr('stw', f'r{31 - i}',
+                               Mem(offset - 4 * (i + 1), 'r1'))
+                         for i in range(num_ints)]
             # pop stack frame
             for i in range(num_floats):
                 offset = size - 0x10 * (i + 1)
-                pop += [f'psq_l p{31 - i}, {hex(offset + 8)}(r1), 0, qr0',
-                        f'lfd f{31 - 1}, {hex(offset)}(r1)']
-            if num_ints > 0:
-                offset = size - 0x10 * num_floats
-                pop += [f'addi r11, r1, {hex(offset)}',
-                        f'bl @FUN_{0x801cbdc4 - 4 * num_ints:08x}']
-            pop += [f'lwz r0, {hex(size + 4)}(r1)',
-                    'mtlr r0',
-                    f'addi r1, r1, {hex(size)}']
+                pop += [Instr('psq_l', f'p{31 - i}', Mem(offset + 8, 'r1'),
+                              '0', 'qr0'),
+                        Instr('lfd', f'f{31 - i}', Mem(offset, 'r1'))]
+            offset = size - 0x10 * num_floats
+            if num_ints > 0 and makes_call:
+                pop += [Instr('addi', 'r11', 'r1', offset),
+                        Instr('bl', Symbol(f'FUN_{0x801cbdc4 - 4 * num_ints:08x}'))]
+            else:
+                pop += [Instr('lwz', f'r{31 - i}',
+                              Mem(offset - 4 * (i + 1), 'r1'))
+                        for i in range(num_ints)]
+            if makes_call:
+                pop += [Instr('lwz', 'r0', Mem(size + 4, 'r1')),
+                        Instr('mtlr', 'r0')]
+            pop.append(Instr('addi', 'r1', 'r1', size))
         return push, pop
 
-    # splits at branch labels
+    # how many registers, counting down from r31/f31, a leaf function
+    # took for temps
+    def _count_saved_registers(self, asm):
+        lowest = {'r': 32, 'f': 32}
+        for line in asm:
+            for reg in line.registers():
+                if type(reg) is str and re.fullmatch(r'[rf]([0-9]+)', reg) \
+                   and int(reg[1:]) >= 14:
+                    lowest[reg[0]] = min(lowest[reg[0]], int(reg[1:]))
+        return 32 - lowest['r'], 32 - lowest['f']
+
+    # splits at branch labels and after branches, so that what a block
+    # leaves live is what all its successors need
     def _make_basic_blocks(self, asm):
         blocks = []
         next_block = []
         for line in asm:
-            if (match := re.match(branch_pattern, line)):
+            if type(line) is Label and len(next_block) > 0:
                 blocks.append(next_block)
                 next_block = []
             next_block.append(line)
+            if is_branch(line) or line.opcode == 'blr':
+                blocks.append(next_block)
+                next_block = []
         if len(next_block) > 0:
             blocks.append(next_block)
         return blocks
 
     def _make_control_flow_graph(self, blocks):
+        # blocks are named by their label; the entry point is -1, and
+        # blocks right after a branch are numbered down from there
+        nodes = []
+        for i, block in enumerate(blocks):
+            if type(block[0]) is Label:
+                nodes.append(block[0].index)
+            else:
+                nodes.append(-1 - i)
         # generate control flow graph
         graph = {}
         for i in range(len(blocks)):
             block = blocks[i]
-            if (match := re.match(branch_pattern, block[0])):
-                node = int(match.group(1))
-            else:
-                # entry point
-                node = -1
+            node = nodes[i]
             graph[node] = set()
             # branches
             for line in block:
-                if line[0] != '@' and (match := re.search(branch_pattern, line)):
-                    graph[node].add(int(match.group(1)))
-                if (match := re.search(r'@SWITCH\(([0-9]+)\)', line)):
-                    switch_idx = int(match.group(1))
+                if (target := branch_target(line)) is not None:
+                    graph[node].add(target.index)
+                if line.opcode == 'bctr':
+                    switch_idx = line.operands[0].index
                     graph[node].update(
                         self.switches[switch_idx]['cases'].values())
             # fall-through
             if i < len(blocks) - 1 \
-               and split_op(block[-1])[0] not in ['b', 'bctr', 'blr']:
-                match = re.match(branch_pattern, blocks[i+1][0])
-                graph[node].add(int(match.group(1)))
+               and block[-1].opcode not in ['b', 'bctr', 'blr']:
+                graph[node].add(nodes[i+1])
         return graph
 
     def _alloc_persistent_registers(self, asm):
         variables = self._find_persistent_variables(asm)
+        # those that don't fit in r14-r31/f14-f31 are kept on the stack,
+        # leaving the registers to the ones used most
+        costs = self._get_spill_costs(asm)
+        slots = {}
+        for kind in ['int', 'float']:
+            candidates = [var for var in variables if variables[var] == kind]
+            candidates.sort(key=lambda var: costs[var], reverse=True)
+            for var in candidates[18:]:
+                slots[var] = self._make_spill_slot(kind)
+        if len(slots) > 0:
+            asm = self._insert_spill_code(asm, [
+                {reg: slots[reg] for reg in line.vregs() if reg in slots}
+                for line in asm])
         # assign persistent variables to registers
         registers = {}
         int_idx = 31
         float_idx = 31
         for var in variables:
-            if variables[var] == 'float':
-                if float_idx < 14:
-                    raise Exception('Max. local floats exceeded')
+            if var in slots:
+                continue
+            elif variables[var] == 'float':
                 registers[var] = f'f{float_idx}'
                 float_idx -= 1
             else:
-                if int_idx < 14:
-                    raise Exception('Max. local ints exceeded')
                 registers[var] = f'r{int_idx}'
                 int_idx -= 1
         # replace placeholders in assembly
-        asm = asm[:]
-        for i in range(len(asm)):
-            vars = re.findall(var_pattern, asm[i])
-            for type, name in vars:
-                if name in registers:
-                    asm[i] = re.sub(f'@{type}\({name}\)', registers[name],
-                                    asm[i])
+        asm = [line.assign(registers) for line in asm]
         # count int vs float registers
         num_ints = sum(1 for reg in registers.values() if reg[0] == 'r')
         num_floats = len(registers) - num_ints
         return asm, num_ints, num_floats
 
+    # persistent variables are those still live after a call
     def _find_persistent_variables(self, asm):
         if len(asm) == 0:
             return {}
         blocks = self._make_basic_blocks(asm)
         cfg = self._make_control_flow_graph(blocks)
-        return self._find_persistent_variables_r(blocks, cfg, {}, {}, -1)
-
-    def _find_persistent_variables_r(self, blocks, cfg, states, visited, index):
-        block = self._get_block_from_branch_index(blocks, index)
-        persistent = {}
-        for line in block:
-            # this pattern intentionally ignores
-            # generated variables (those bookended by _)
-            pattern = r'@(INT|FLOAT)\(([a-z][_a-zA-Z0-9]*)\)'
-            vars = re.findall(pattern, line)
-            for type, name in vars:
-                if op_sets_var(line, name, False) or states[name]:
-                    states[name] = True # "fresh"
-                else:
-                    persistent[name] = type.lower()
-            if is_call(line):
-                for name in states:
-                    states[name] = False # "stale"
-        if index not in visited:
-            visited[index] = 0
-        else:
-            visited[index] += 1
-        # only traverse loops twice
-        if visited[index] == 1 and \
-           all(edge not in visited or visited[edge] == 1
-               for edge in cfg[index]):
-            return persistent
-        for edge in cfg[index]:
-            if edge in visited and visited[edge] == 1:
-                continue
-            persistent.update(
-                self._find_persistent_variables_r(blocks, cfg, states.copy(),
-                                                  visited.copy(), edge))
-        return persistent
-
-    def _get_block_from_branch_index(self, blocks, index):
-        if index == -1:
-            return blocks[0]
-        for block in blocks:
-            if block[0] == f'@BRANCH({index})':
-                return block
-        raise Exception(f"No block exists with branch index '{index}'")
-
-    def _alloc_temp_registers(self, asm):
-        asm = asm[:]
-        groups = self._group_lines(asm)
-        for group in groups:
-            graph = self._make_interference_graph(asm, group)
-            block = [line for i,line in enumerate(asm) if i in group]
-            regs = self._assign_temp_registers(graph, block)
-            # replace placeholders in assembly
-            for i in group:
-                vars = re.findall(var_pattern, asm[i])
-                for type, name in vars:
-                    asm[i] = re.sub(f'@{type}\({name}\)', regs[name], asm[i])
-        return asm
+        # index blocks by their branch index
+        blocks = dict(zip(cfg, blocks))
+        # sets of variables are bitsets, numbered in order of appearance;
+        # generated variables (those bookended by _) are ignored
+        bits = {}
+        for line in asm:
+            for var in line.vregs():
+                if var.name[0] != '_' and var not in bits:
+                    bits[var] = 1 << len(bits)
+        # what each block reads before writing, and writes
+        uses = {}
+        defs = {}
+        for node, block in blocks.items():
+            uses[node] = 0
+            defs[node] = 0
+            for line in block:
+                read, written = self._get_uses_and_defs(line, bits)
+                uses[node] |= read & ~defs[node]
+                defs[node] |= written
+        live_out = self._solve_liveness(cfg, uses, defs)
+        # find what is live right after each call
+        persistent = 0
+        for node, block in blocks.items():
+            live = live_out[node]
+            for line in reversed(block):
+                if is_call(line):
+                    persistent |= live
+                read, written = self._get_uses_and_defs(line, bits)
+                live = read | (live & ~written)
+        return {var: var.type for var in bits if persistent & bits[var]}
 
-    # groups connected sections of code, i.e. lines
-    # of code that are not separated by calls
-    def _group_lines(self, asm):
-        lines_left = set(range(len(asm)))
-        groups = []
-        while len(lines_left) > 0:
-            next_line = min(lines_left)
-            group = self._group_lines_r(asm, set(), next_line)
-            # get index of first non-empty intersection, if any
-            idx = next((i for i,n in enumerate(g & group for g in groups)
-                        if n != set()), None)
-            if idx is not None:
-                # merge overlapping groups
-                groups[idx] |= group
-            else:
-                groups.append(group)
-            lines_left -= group
-        return groups
+    # the control flow graph, the lines in each block, a bit for each
+    # virtual register and the bitset of those live leaving each block
+    def _get_block_liveness(self, asm, effects):
+        blocks = self._make_basic_blocks(asm)
+        cfg = self._make_control_flow_graph(blocks)
+        ranges = {}
+        start = 0
+        for node, block in zip(cfg, blocks):
+            ranges[node] = range(start, start + len(block))
+            start += len(block)
+        bits = {}
+        for read, written in effects:
+            for reg in read + written:
+                if reg not in bits:
+                    bits[reg] = 1 << len(bits)
+        uses = {}
+        defs = {}
+        for node in cfg:
+            uses[node] = 0
+            defs[node] = 0
+            for i in ranges[node]:
+                read, written = effects[i]
+                for reg in read:
+                    uses[node] |= bits[reg] & ~defs[node]
+                for reg in written:
+                    defs[node] |= bits[reg]
+        live_out = self._solve_liveness(cfg, uses, defs)
+        return cfg, ranges, bits, live_out
 
-    def _group_lines_r(self, asm, group, line_num):
-        for i in range(line_num, len(asm)):
-            if i in group:
-                break
-            group.add(i)
-            line = asm[i]
-            if is_branch(line):
-                match = re.search(r'@(BRANCH|SWITCH)\(([0-9]+)\)', line)
-                if match.group(1) == 'SWITCH':
-                    idx = int(match.group(2))
-                    for branch in self.switches[idx]['cases'].values():
-                        line_num = asm.index(f'@BRANCH({branch})')
-                        self._group_lines_r(asm, group, line_num)
-                else:
-                    line_num = asm.index(f'@BRANCH({match.group(2)})')
-                    self._group_lines_r(asm, group, line_num)
-            if split_op(line)[0] == 'b' or is_call(line):
-                break
-        return group
+    # worklist solution of the liveness equations, given what each block
+    # reads before writing and what it writes
+    def _solve_liveness(self, cfg, uses, defs):
+        preds = {node: [] for node in cfg}
+        for node in cfg:
+            for edge in cfg[node]:
+                preds[edge].append(node)
+        live_in = dict.fromkeys(cfg, 0)
+        live_out = dict.fromkeys(cfg, 0)
+        pending = list(cfg)
+        queued = set(pending)
+        while pending:
+            node = pending.pop()
+            queued.discard(node)
+            live = 0
+            for edge in cfg[node]:
+                live |= live_in[edge]
+            live_out[node] = live
+            live = uses[node] | (live & ~defs[node])
+            if live != live_in[node]:
+                live_in[node] = live
+                for pred in preds[node]:
+                    if pred not in queued:
+                        pending.append(pred)
+                        queued.add(pred)
+        return live_out
 
-    def _make_interference_graph(self, asm, group):
-        unvisited = group.copy()
-        graph = {}
-        while unvisited:
-            visited = self._make_interference_graph_r(asm, group, max(unvisited),
-                                                      set(), graph)
-            unvisited -= visited
-        return graph
+    def _get_uses_and_defs(self, line, bits):
+        read, written = self._get_operands(line)
+        return (sum(bits.get(reg, 0) for reg in set(read)),
+                sum(bits.get(reg, 0) for reg in set(written)))
 
-    def _make_interference_graph_r(self, asm, group, start, live, graph, loop=False):
-        visited = set()
-        i = start
-        while not (branch := re.match(branch_pattern, asm[i])):
-            line = asm[i]
-            vars = re.findall(var_pattern, line)
-            for type, name in vars:
-                if name not in graph:
-                    graph[name] = { 'edges': set(), 'type': type.lower() }
-                if op_sets_var(line, name):
-                    # handles variables unused after being set
-                    for var in live:
-                        if var != name:
-                            graph[var]['edges'].add(name)
-                            graph[name]['edges'].add(var)
-                    if op_sets_var(line, name, False):
-                        live.discard(name)
-                    else:
-                        live.add(name)
-                else:
-                    live.add(name)
-            for var in live:
-                graph[var]['edges'] = graph[var]['edges'] | (live - {var})
-            # reset 'live' after call & initialize with function params
+    # registers a line reads and writes; an update does both
+    def _get_operands(self, line):
+        regs = line.registers()
+        if len(regs) > 0 and op_sets_var(line, regs[0]):
+            read, written = regs[1:], regs[:1]
+        # rlwimi only replaces some of the bits, keeping the rest
+        elif line.opcode == 'rlwimi':
+            read, written = regs, regs[:1]
+        else:
+            read, written = regs, []
+        # as do update loads and stores, for their address
+        if line.opcode in ops.load_ops | ops.store_ops and is_update(line):
+            written = written + get_base_registers(line)[:1]
+        return read, written
+
+    # virtual registers each line reads and writes; a call reads the
+    # args set up before it and writes the return registers
+    def _get_line_effects(self, asm):
+        returns = [int_reg('_r3_'), float_reg('_f1_')]
+        effects = []
+        args = []
+        for line in asm:
             if is_call(line):
-                live = set()
-                j = i - 1
-                while (match := re.search('_([fr])[0-9]+_', asm[j])):
-                    name = match.group()
-                    type = 'float' if match.group(1) == 'f' else 'int'
-                    live.add(name)
-                    graph[name] = { 'edges': set(), 'type': type }
-                    j -= 1
-            visited.add(i)
-            if (i-1) not in group or is_unconditional_branch(asm[i-1]):
+                effects.append((args, returns))
+                args = []
+                continue
+            read, written = self._get_operands(line)
+            read = [reg for reg in read if type(reg) is VReg]
+            written = [reg for reg in written if type(reg) is VReg]
+            if len(written) > 0 \
+               and re.fullmatch(precolored_pattern, written[0].name):
+                args = args + written
+            elif type(line) is Label or is_branch(line):
+                args = []
+            effects.append((read, written))
+        return effects
+
+    def _alloc_temp_registers(self, asm, leaf=False):
+        if len(asm) == 0:
+            return asm
+        while True:
+            webs, registers, spilled = self._color_temp_registers(asm, leaf)
+            if len(spilled) == 0:
                 break
-            i -= 1
-        end = i
-        visited.add(end)
-        # fall-through
-        if end - 1 in group and not is_unconditional_branch(asm[end-1]):
-            visited |= self._make_interference_graph_r(asm, group, end - 1,
-                                                       live.copy(), graph, loop)
-        # branching
-        if branch:
-            for i in group:
+            # keep what didn't get a register on the stack and try again
+            slots = {web: self._make_spill_slot(reg.type)
+                     for web, reg in spilled.items()}
+            asm = self._insert_spill_code(asm, [
+                {reg: slots[web] for reg, web in line_webs.items()
+                 if web in slots}
+                for line_webs in webs])
+        # replace placeholders in assembly
+        return [line.assign({reg: registers[web]
+                             for reg, web in webs[i].items()})
+                for i, line in enumerate(asm)]
+
+    def _color_temp_registers(self, asm, leaf=False):
+        effects = self._get_line_effects(asm)
+        cfg, ranges, bits, live_out = self._get_block_liveness(asm, effects)
+        live_out = {node: [reg for reg in bits if live_out[node] & bits[reg]]
+                    for node in cfg}
+
+        webs, exits, live_ranges = self._make_live_ranges(effects, cfg, ranges,
+                                                          live_out)
+        graph = self._make_interference_graph(asm, effects, cfg, ranges,
+                                              webs, exits, len(live_ranges))
+        registers = self._color_interference_graph(asm, webs, live_ranges,
+                                                   graph, leaf)
+        spilled = {web: reg for web, reg in enumerate(live_ranges)
+                   if web not in registers}
+        return webs, registers, spilled
+
+    # splits registers into live ranges (webs), so that reusing a name
+    # like _temp_ doesn't tie unrelated values to one register; returns
+    # the live range of each register on each line and leaving each
+    # block, and the register each live range belongs to
+    def _make_live_ranges(self, effects, cfg, ranges, live_out):
+        # every definition starts a live range, and ranges meeting at
+        # the start of a block are merged (union-find)
+        parents = []
+        entries = {}
+        exits = {}
+        webs = []
+        for node in cfg:
+            entries[node] = {}
+            current = {}
+            for i in ranges[node]:
+                read, written = effects[i]
+                line_webs = {}
+                for reg in read:
+                    if reg not in current:
+                        parents.append(len(parents))
+                        current[reg] = entries[node][reg] = parents[-1]
+                    line_webs[reg] = current[reg]
+                for reg in written:
+                    # updates stay in the range they read from
+                    if reg not in line_webs:
+                        parents.append(len(parents))
+                        line_webs[reg] = parents[-1]
+                    current[reg] = line_webs[reg]
+                webs.append(line_webs)
+            for reg in live_out[node]:
+                if reg not in current:
+                    parents.append(len(parents))
+                    current[reg] = entries[node][reg] = parents[-1]
+            exits[node] = {reg: current[reg] for reg in live_out[node]}
+        for node in cfg:
+            for edge in cfg[node]:
+                for reg, web in entries[edge].items():
+                    parents[self._find_group(parents, web)] = \
+                        self._find_group(parents, exits[node][reg])
+        # number the merged ranges
+        numbers = {}
+        live_ranges = []
+        for line_webs in webs + list(exits.values()):
+            for reg, web in line_webs.items():
+                web = self._find_group(parents, web)
+                if web not in numbers:
+                    numbers[web] = len(live_ranges)
+                    live_ranges.append(reg)
+                line_webs[reg] = numbers[web]
+        return webs, exits, live_ranges
+
+    def _find_group(self, parents, i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    # bitsets of the live ranges each live range is live alongside
+    def _make_interference_graph(self, asm, effects, cfg, ranges, webs,
+                                 exits, count):
+        graph = [0] * count
+        for node in cfg:
+            live = 0
+            for web in exits[node].values():
+                live |= 1 << web
+            for i in reversed(ranges[node]):
                 line = asm[i]
-                if (switch := re.search(r'@SWITCH\(([0-9]+)\)', line)):
-                    switch_idx = int(switch.group(1))
-                    branch_idx = int(branch.group(1))
-                    if branch_idx in self.switches[switch_idx]['cases'].values():
-                        visited |= self._make_interference_graph_r(asm, group, i,
-                                                                   live.copy(),
-                                                                   graph, loop)
-                elif line[0] != '@' and f'@BRANCH({branch.group(1)})' in line:
-                    if i > end:
-                        if loop:
-                            continue
-                        loop = True
-                    visited |= self._make_interference_graph_r(asm, group, i,
-                                                               live.copy(),
-                                                               graph, loop)
-        return visited
-
-    def _assign_temp_registers(self, graph, block):
+                read, written = effects[i]
+                for reg in written:
+                    web = webs[i][reg]
+                    edges = live & ~(1 << web)
+                    # a copy can share a register with what it copies
+                    if is_move(line) and type(line.operands[1]) is VReg:
+                        edges &= ~(1 << webs[i][line.operands[1]])
+                    graph[web] |= edges
+                for reg in written:
+                    live &= ~(1 << webs[i][reg])
+                for reg in read:
+                    live |= 1 << webs[i][reg]
+        # make edges go both ways
+        for web in range(count):
+            for edge in set_bits(graph[web]):
+                graph[edge] |= 1 << web
+        return graph
+
+    # Chaitin-Briggs graph coloring: live ranges with fewer neighbors
+    # than free registers are set aside until only hard ones are left,
+    # then registers are handed out in reverse order
+    def _color_interference_graph(self, asm, webs, live_ranges, graph,
+                                  leaf=False):
         registers = {}
-        for var in graph:
+        allowed = []
+        classes = {}
+        for web, reg in enumerate(live_ranges):
+            classes[reg.type] = classes.get(reg.type, 0) | 1 << web
             # pre-color function args
-            if (match := re.match('_([fr][0-9]+)_', var)):
-                registers[var] = match.group(1)
-        for var in filter(lambda x : x not in registers, graph):
-            if graph[var]['type'] == 'float':
-                regs = [f'f{n}' for n in range(14)]
+            if (match := re.fullmatch(precolored_pattern, reg.name)):
+                registers[web] = match.group(1)
+            allowed.append(temp_registers[reg.type]
+                           + (saved_registers[reg.type] if leaf else []))
+        # int and float registers don't compete
+        graph = [edges & classes[live_ranges[web].type]
+                 for web, edges in enumerate(graph)]
+        # costs of not getting a register weigh uses in loops higher
+        depths = self._get_loop_depths(asm)
+        costs = [0] * len(live_ranges)
+        moves = []
+        for i, line in enumerate(asm):
+            for reg, web in webs[i].items():
+                # reloads can't be spilled again
+                if re.fullmatch(spill_pattern, reg.name):
+                    costs[web] = math.inf
+                costs[web] += 10 ** depths[i]
+            # some commands break w/ r0
+            for reg in get_base_registers(line):
+                if reg in webs[i] and 'r0' in allowed[webs[i][reg]]:
+                    allowed[webs[i][reg]].remove('r0')
+            if is_move(line) and all(reg in webs[i] for reg in line.operands):
+                dest, src = [webs[i][reg] for reg in line.operands]
+                moves.append((10 ** depths[i], dest, src))
+
+        # coalesce, then try to give what's left of each move the same
+        # register on both ends
+        aliases = self._coalesce_moves(graph, moves, registers, allowed, costs)
+        partners = [[] for _ in live_ranges]
+        for _, dest, src in moves:
+            dest = self._find_group(aliases, dest)
+            src = self._find_group(aliases, src)
+            if dest != src:
+                partners[dest].append(src)
+                partners[src].append(dest)
+
+        # simplify
+        degrees = [edges.bit_count() for edges in graph]
+        low = []
+        high = set()
+        for web in range(len(live_ranges)):
+            if web in registers or aliases[web] != web:
+                continue
+            elif degrees[web] < len(allowed[web]):
+                low.append(web)
             else:
-                regs = [f'r{n}' for n in range(3, 13)]
-            # some commands break w/ r0; make sure var
-            # is a valid candidate for its use
-            if graph[var]['type'] == 'int' \
-               and self._can_var_use_r0(var, block):
-                regs.insert(0, 'r0')
-            for edge in graph[var]['edges']:
-                if edge in registers and registers[edge] in regs:
-                    regs.remove(registers[edge])
-            # try to assign so as to reduce moves
-            for line in block:
-                args = split_op(line)
-                if is_move(line) and var in args:
-                    copy_var = args[1] if args[1] != var else args[2]
-                    if copy_var in registers \
-                       and registers[copy_var] in regs:
-                        registers[var] = registers[copy_var]
-                        break
-            # if no way to reduce moves, use first available register
-            if var not in registers:
-                registers[var] = regs[0]
+                high.add(web)
+        removed = 0
+        stack = []
+        while low or high:
+            if low:
+                web = low.pop()
+            else:
+                # optimistically set aside the range cheapest to spill
+                web = min(high, key=lambda web: (costs[web] / degrees[web], web))
+                high.remove(web)
+            stack.append(web)
+            removed |= 1 << web
+            for edge in set_bits(graph[web] & ~removed):
+                degrees[edge] -= 1
+                if edge in high and degrees[edge] < len(allowed[edge]):
+                    high.remove(edge)
+                    low.append(edge)
+
+        # select
+        while stack:
+            web = stack.pop()
+            taken = {registers.get(edge) for edge in set_bits(graph[web])}
+            regs = [reg for reg in allowed[web] if reg not in taken]
+            if len(regs) == 0:
+                if costs[web] == math.inf:
+                    raise Exception('Max. temp registers exceeded')
+                # left to be spilled
+                continue
+            # try to assign so as to reduce moves, without taking what
+            # a neighbor yet to be assigned would want for its own
+            preferred = [registers.get(partner) for partner in partners[web]]
+            wanted = {registers.get(partner)
+                      for edge in set_bits(graph[web]) if edge not in registers
+                      for partner in partners[edge]}
+            regs.sort(key=lambda reg: (reg not in preferred, reg in wanted))
+            registers[web] = regs[0]
+        for web in range(len(live_ranges)):
+            alias = self._find_group(aliases, web)
+            if alias in registers:
+                registers[web] = registers[alias]
         return registers
 
-    def _can_var_use_r0(self, var, block):
-        for line in block:
-            args = split_op(line)
-            if args[0] in {'addi', 'subi'} and args[2] == var:
-                return False
-            elif args[0] in ops.load_ops | ops.store_ops:
-                if args[0][-1] == 'x' and args[2] == var:
-                    return False
-                elif args[3] == var:
-                    return False
-        return True
+    # merges the two ends of a move into one live range where they don't
+    # interfere, and only where it's sure not to make the graph harder
+    # to color: either the merged range would have fewer neighbors with
+    # many neighbors than there are registers (Briggs), or, when one end
+    # has a fixed register, every neighbor of the other end is already a
+    # neighbor of it or has few neighbors (George); moves run most often
+    # go first. returns what each live range was merged into
+    def _coalesce_moves(self, graph, moves, registers, allowed, costs):
+        aliases = list(range(len(graph)))
+        # ranges with a fixed register count as having too many neighbors
+        def significant(web):
+            return web in registers \
+                   or graph[web].bit_count() >= len(allowed[web])
+        for _, dest, src in sorted(moves, key=lambda move: -move[0]):
+            a = self._find_group(aliases, dest)
+            b = self._find_group(aliases, src)
+            if b in registers:
+                a, b = b, a
+            if a == b or b in registers or graph[a] >> b & 1 \
+               or math.inf in (costs[a], costs[b]):
+                continue
+            if a in registers:
+                if registers[a] not in allowed[b] \
+                   or any(significant(web)
+                          for web in set_bits(graph[b] & ~graph[a])):
+                    continue
+            else:
+                regs = [reg for reg in allowed[a] if reg in allowed[b]]
+                count = sum(significant(web)
+                            for web in set_bits(graph[a] | graph[b]))
+                if count >= len(regs):
+                    continue
+                allowed[a] = regs
+            # merge b into a
+            aliases[b] = a
+            costs[a] += costs[b]
+            for web in set_bits(graph[b]):
+                graph[web] = graph[web] & ~(1 << b) | 1 << a
+            graph[a] |= graph[b]
+            graph[b] = 0
+        return aliases
+
+    # uses of each register, weighing those in loops higher
+    def _get_spill_costs(self, asm):
+        depths = self._get_loop_depths(asm)
+        costs = {}
+        for i, line in enumerate(asm):
+            for reg in line.vregs():
+                costs[reg] = costs.get(reg, 0) + 10 ** depths[i]
+        return costs
+
+    # stack slot for a register to live in, laid out with the arrays
+    def _make_spill_slot(self, kind):
+        name = f'_spill{len(self.arrays)}_'
+        self.arrays[name] = {'type': kind, 'size': 2 if kind == 'float' else 1}
+        return name
+
+    # reloads spilled registers before each line reading them and stores
+    # them after each line writing them, in a temp named after the slot;
+    # slots gives the spilled registers of each line. a value written
+    # for the very next line is handed over in the temp instead
+    def _insert_spill_code(self, asm, slots):
+        new_asm = []
+        carried = {}
+        slots = slots + [{}]
+        for i, line in enumerate(asm):
+            if len(slots[i]) == 0:
+                new_asm.append(line)
+                carried = {}
+                continue
+            read, written = self._get_operands(line)
+            temps = {reg: VReg(slot, reg.type) for reg, slot in slots[i].items()}
+            for reg, slot in slots[i].items():
+                if reg in read and carried.get(reg) != slot:
+                    load = 'lfd' if reg.type == 'float' else 'lwz'
+                    new_asm.append(Instr(load, temps[reg],
+                                         Mem(ArraySlot(slot), 'r1')))
+            new_asm.append(line.assign(temps))
+            # the next line's reads can use the temp as is, and if it
+            # writes the register again only its store is needed
+            carried = {reg: slot for reg, slot in slots[i].items()
+                       if reg in written and slots[i + 1].get(reg) == slot}
+            next_written = self._get_operands(asm[i + 1])[1] \
+                           if len(carried) > 0 else []
+            for reg, slot in slots[i].items():
+                if reg in written and not (reg in carried
+                                           and reg in next_written):
+                    store = 'stfd' if reg.type == 'float' else 'stw'
+                    new_asm.append(Instr(store, temps[reg],
+                                         Mem(ArraySlot(slot), 'r1')))
+        return new_asm
+
+    # how many loops each line is in, going by backward branches
+    def _get_loop_depths(self, asm):
+        labels = {line.index: i for i, line in enumerate(asm)
+                  if type(line) is Label}
+        changes = [0] * (len(asm) + 1)
+        for i, line in enumerate(asm):
+            target = branch_target(line)
+            if target is not None and labels[target.index] <= i:
+                changes[labels[target.index]] += 1
+                changes[i + 1] -= 1
+        depths = []
+        depth = 0
+        for change in changes[:-1]:
+            depth += change
+            depths.append(depth)
+        return depths
 
     def _assemble_if(self, node):
         asm = []
@@ -605,18 +1943,18 @@ class Assembler:
             for line in node.blocks[i][1]:
                 block += self._assemble_node(line)
             if i < len(node.blocks) - 1:
-                block.append(f'b @BRANCH({end_idx})')
+                block.append(Instr('b', Label(end_idx)))
             if node.blocks[i][0] is not None:
                 body_idx = self.next_branch_index()
                 condition = self._assemble_condition(node.blocks[i][0],
                                                      body_idx,
                                                      next_idx)
-                block = condition + [f'@BRANCH({body_idx})'] + block
+                block = condition + [Label(body_idx)] + block
             if i > 0:
                 next_idx = self.next_branch_index()
-                block.insert(0, f'@BRANCH({next_idx})')
+                block.insert(0, Label(next_idx))
             asm = block + asm
-        return asm + [f'@BRANCH({end_idx})']
+        return asm + [Label(end_idx)]
 
     def _assemble_condition(self, node, true_idx, false_idx):
         asm = []
@@ -624,63 +1962,130 @@ class Assembler:
             asm += self._assemble_comparison(node.left)
             if node.connective == 'and':
                 comp = inv_comps[node.left.comparator]
-                asm.append(f'b{comp} @BRANCH({false_idx})')
+                asm.append(Instr(f'b{comp}', Label(false_idx)))
             else:
                 comp = node.left.comparator
-                asm.append(f'b{comp} @BRANCH({true_idx})')
+                asm.append(Instr(f'b{comp}', Label(true_idx)))
             node = node.right
         asm += self._assemble_comparison(node) \
-               + [f'b{inv_comps[node.comparator]} @BRANCH({false_idx})']
+               + [Instr(f'b{inv_comps[node.comparator]}', Label(false_idx))]
         return asm
 
     def _assemble_comparison(self, node):
         asm = []
-        if type(node.left) is not Variable:
+        if type(node.left) is Number:
+            arg1 = '_temp_'
+            asm += self._generate_load(node.left.value, int_reg(arg1))
+        elif type(node.left) is not Variable:
             arg1 = '_temp_'
             asm += self._generate_math(node.left, arg1)
         else:
             arg1 = node.left
-        if type(node.right) is Number:
+        if type(node.right) is Number and node.right.value > 0xffff:
+            # too big for an immediate
+            asm += self._generate_load(node.right.value, int_reg('_temp1_'))
+            asm.append(Instr('cmplw', int_reg(arg1), int_reg('_temp1_')))
+        elif type(node.right) is Number:
             # cmpwi will treat a number > 0x7fff as negative
             op = 'cmpwi' if node.right.value < 0x8000 else 'cmplwi'
             # floats cannot be compared with literals
-            asm.append(f'{op} @INT({arg1}), {node.right}')
+            asm.append(Instr(op, int_reg(arg1), node.right.value))
+        elif node.type == 'float':
+            asm.append(Instr('fcmpu', 'cr0', float_reg(arg1),
+                             float_reg(node.right)))
         else:
-            op = 'fcmpu cr0,' if node.type == 'float' else 'cmpw'
-            type_ = node.type.upper()
-            asm.append(f'{op} @{type_}({arg1}), @{type_}({node.right})')
+            asm.append(Instr('cmpw', int_reg(arg1), int_reg(node.right)))
         return asm
 
     def _assemble_for(self, node):
-        self.continue_idx = self.next_branch_index()
-        self.break_idx = self.next_branch_index()
+        continue_idx = self.continue_idx = self.next_branch_index()
+        break_idx = self.break_idx = self.next_branch_index()
         body_idx = self.next_branch_index()
-        asm = [f'li @INT({node.var}), 0x0',
-               f'@BRANCH({body_idx})']
+        var = int_reg(node.var)
+        body = []
         for line in node.body:
-            asm += self._assemble_node(line)
-        asm += [f'@BRANCH({self.continue_idx})',
-                f'addi @INT({node.var}), @INT({node.var}), 0x1']
+            body += self._assemble_node(line)
+        if self._can_count_down(node, body):
+            return self._assemble_counted_for(node, body, continue_idx,
+                                              break_idx, body_idx)
+        asm = [Instr('li', var, 0),
+               Label(body_idx)]
+        asm += body
+        asm += [Label(continue_idx),
+                Instr('addi', var, var, 1)]
         if type(node.range) is Variable:
-            asm.append(f'cmpw @INT({node.var}), @INT({node.range})')
+            asm.append(Instr('cmpw', var, int_reg(node.range)))
         else:
-            asm.append(f'cmpwi @INT({node.var}), {node.range}')
-        asm += [f'blt @BRANCH({body_idx})',
-                f'@BRANCH({self.break_idx})']
+            asm.append(Instr('cmpwi', var, node.range.value))
+        asm += [Instr('blt', Label(body_idx)),
+                Label(break_idx)]
+        return asm
+
+    # the count register can run the loop as long as nothing in it uses
+    # the register too, and the count is fixed going in
+    def _can_count_down(self, node, body):
+        fixed = [int_reg(node.var)]
+        if type(node.range) is Variable:
+            fixed.append(int_reg(node.range))
+        for line in body:
+            if is_call(line) or line.opcode in ['mtctr', 'bctr'] \
+               or any(reg in fixed for reg in get_changed_registers(line)):
+                return False
+        return True
+
+    # runs the body with mtctr/bdnz. like the compare it replaces, the
+    # body runs at least once. the index is only counted if the body
+    # reads it or can break out early; otherwise it's just set to where
+    # it would have ended up, which goes away if nothing reads it
+    def _assemble_counted_for(self, node, body, continue_idx, break_idx,
+                              body_idx):
+        var = int_reg(node.var)
+        count = int_reg('_count_')
+        asm = []
+        if type(node.range) is Variable:
+            # the clamp gets a label of its own so that the count is
+            # seen to reach mtctr both ways
+            clamp_idx = self.next_branch_index()
+            skip_idx = self.next_branch_index()
+            asm += [Instr('mr', count, int_reg(node.range)),
+                    Instr('cmpwi', count, 0),
+                    Instr('bgt', Label(skip_idx)),
+                    Label(clamp_idx),
+                    Instr('li', count, 1),
+                    Label(skip_idx)]
+        else:
+            asm += self._generate_load(max(node.range.value, 1), count)
+        asm.append(Instr('mtctr', count))
+        indexed = any(var in line.registers() for line in body) \
+                  or any(branch_target(line) == Label(break_idx)
+                         for line in body)
+        if indexed:
+            asm.append(Instr('li', var, 0))
+        asm.append(Label(body_idx))
+        asm += body
+        asm.append(Label(continue_idx))
+        if indexed:
+            asm.append(Instr('addi', var, var, 1))
+        asm.append(Instr('bdnz', Label(body_idx)))
+        if not indexed and type(node.range) is Variable:
+            asm.append(Instr('mr', var, count))
+        elif not indexed:
+            asm += self._generate_load(max(node.range.value, 1), var)
+        asm.append(Label(break_idx))
         return asm
 
     def _assemble_while(self, node):
         self.continue_idx = self.next_branch_index()
         self.break_idx = self.next_branch_index()
         body_idx = self.next_branch_index()
-        asm = [f'@BRANCH({self.continue_idx})']
+        asm = [Label(self.continue_idx)]
         asm += self._assemble_condition(node.condition, body_idx,
                                         self.break_idx)
-        asm.append(f'@BRANCH({body_idx})')
+        asm.append(Label(body_idx))
         for line in node.body:
             asm += self._assemble_node(line)
-        asm += [f'b @BRANCH({self.continue_idx})',
-                f'@BRANCH({self.break_idx})']
+        asm += [Instr('b', Label(self.continue_idx)),
+                Label(self.break_idx)]
         return asm
 
     def _assemble_switch(self, node):
@@ -692,31 +2097,93 @@ class Assembler:
             block = []
             if len(node.blocks[i].cases) == 0:
                 default_idx = self.next_branch_index()
-                block += [f'@BRANCH({default_idx})']
+                block += [Label(default_idx)]
             else:
                 for case in node.blocks[i].cases:
                     branch_idx = self.next_branch_index()
-                    block.append(f'@BRANCH({branch_idx})')
+                    block.append(Label(branch_idx))
                     switch['cases'][case] = branch_idx
             for line in node.blocks[i].body:
                 block += self._assemble_node(line)
             if i < len(node.blocks) - 1:
-                block.append(f'b @BRANCH({exit_idx})')
+                block.append(Instr('b', Label(exit_idx)))
             asm += block
         switch['default'] = default_idx
+        var = int_reg(node.var)
+        cases = sorted(switch['cases'].items())
+        # each way in as (code, first case in its table if it has one,
+        # lines of table, lines run on average)
+        low, high = cases[0][0], cases[-1][0]
+        ways = [(self._assemble_switch_compares(var, cases, default_idx),
+                 None, 0, compares_time(len(cases))),
+                (self._assemble_switch_tree(var, cases, default_idx),
+                 None, 0, compare_tree_time(len(cases)))]
+        # a table starting at 0 saves subtracting the lowest case
+        for start in sorted({0, low}):
+            if high - start <= 0xffff:
+                code = self._assemble_switch_table(var, switch, start)
+                ways.append((code, start, high - start + 1, len(code)))
+        time_weight, size_weight = cost_weights[self.optimize]
+        code, start, _, _ = min(ways, key=lambda way: time_weight * way[3]
+                                + size_weight * (len(way[0]) + way[2]))
+        if start is not None:
+            switch['low'] = start
+            self.switches.append(switch)
+        return code + asm + [Label(exit_idx)]
+
+    # indexes into a table of where each case from low up goes
+    def _assemble_switch_table(self, var, switch, low):
         switch_idx = len(self.switches)
-        max_case = max(switch['cases'])
-        asm = [f'cmplwi @INT({node.var}), {hex(max_case)}',
-               f'bgt @BRANCH({default_idx})',
-               f'lis @INT(_addr_), @SWITCH_TABLE({switch_idx})',
-               f'addi @INT(_addr_), @INT(_addr_), @SWITCH_TABLE({switch_idx})',
-               f'rlwinm @INT(_offset_), @INT({node.var}), 0x2, 0x0, 0x1d',
-               f'lwzx @INT(_addr_), @INT(_addr_), @INT(_offset_)',
-               f'mtctr @INT(_addr_)',
-               f'bctr @SWITCH({switch_idx})'] + asm + [f'@BRANCH({exit_idx})']
-        self.switches.append(switch)
+        high = max(switch['cases'])
+        addr = int_reg('_addr_')
+        offset = int_reg('_offset_')
+        asm = []
+        if low > 0:
+            index = int_reg('_index_')
+            asm += self._generate_load(low, index)
+            asm.append(Instr('sub', index, var, index))
+            var = index
+        asm += [Instr('cmplwi', var, high - low),
+                Instr('bgt', Label(switch['default'])),
+                Instr('lis', addr, SwitchTable(switch_idx)),
+                Instr('addi', addr, addr, SwitchTable(switch_idx)),
+                Instr('rlwinm', offset, var, 2, 0, 0x1d),
+                Instr('lwzx', addr, addr, offset),
+                Instr('mtctr', addr),
+                Instr('bctr', SwitchTable(switch_idx))]
         return asm
 
+    # one case after another
+    def _assemble_switch_compares(self, var, cases, default_idx):
+        asm = []
+        for case, branch_idx in cases:
+            asm += self._generate_case_compare(var, case)
+            asm.append(Instr('beq', Label(branch_idx)))
+        asm.append(Instr('b', Label(default_idx)))
+        return asm
+
+    # halves the cases left at each compare
+    def _assemble_switch_tree(self, var, cases, default_idx):
+        if len(cases) <= 3:
+            return self._assemble_switch_compares(var, cases, default_idx)
+        middle = len(cases) // 2
+        case, branch_idx = cases[middle]
+        upper_idx = self.next_branch_index()
+        return self._generate_case_compare(var, case) \
+               + [Instr('beq', Label(branch_idx)),
+                  Instr('bgt', Label(upper_idx))] \
+               + self._assemble_switch_tree(var, cases[:middle], default_idx) \
+               + [Label(upper_idx)] \
+               + self._assemble_switch_tree(var, cases[middle+1:],
+                                            default_idx)
+
+    # cases are unsigned, same as the table's bounds check
+    def _generate_case_compare(self, var, case):
+        if case > 0xffff:
+            return self._generate_load(case, int_reg('_temp1_')) \
+                   + [Instr('cmplw', var, int_reg('_temp1_'))]
+        return [Instr('cmplwi', var, case)]
+
     def _assemble_call(self, node):
         asm = []
         int_idx = 3
@@ -728,19 +2195,21 @@ class Assembler:
             else:
                 name = f'_r{int_idx}_'
             if type(arg) is Number:
-                load = self._generate_load(arg.value, name=name)
+                load = self._generate_load(arg.value, int_reg(name))
                 asm += load
             elif type(arg) is Variable:
                 if arg.type == 'float':
-                    asm.append(f'fmr @FLOAT({name}), @FLOAT({arg})')
+                    asm.append(Instr('fmr', float_reg(name), float_reg(arg)))
                 else:
-                    asm.append(f'mr @INT({name}), @INT({arg})')
+                    asm.append(Instr('mr', int_reg(name), int_reg(arg)))
             elif type(arg) is Pointer:
                 if arg.type == 'array':
-                    asm.append(f'addi @INT({name}), r1, @ARRAY({arg})')
+                    asm.append(Instr('addi', int_reg(name), 'r1',
+                                     ArraySlot(str(arg))))
                 else:
-                    asm.append(f'lis @INT({name}), &{arg}')
-                    asm.append(f'addi @INT({name}), @INT({name}), &{arg}')
+                    asm.append(Instr('lis', int_reg(name), Address(str(arg))))
+                    asm.append(Instr('addi', int_reg(name), int_reg(name),
+                                     Address(str(arg))))
             else:
                 raise Exception(f'UNHANDLED ARGUMENT: {arg}')
             if type(arg) is Variable and arg.type == 'float':
@@ -748,10 +2217,10 @@ class Assembler:
             else:
                 int_idx += 1
         if node.type is Pointer:
-            asm += [f'mtctr @INT({node.function})',
-                    f'bctrl']
+            asm += [Instr('mtctr', int_reg(node.function)),
+                    Instr('bctrl')]
         else:
-            asm.append(f'bl @{node.function}')
+            asm.append(Instr('bl', Symbol(node.function)))
         return asm
 
     def _assemble_set(self, node):
@@ -762,39 +2231,51 @@ class Assembler:
             name = node.var.name
         asm = []
         if type(node.expression) is Number:
-            load = self._generate_load(node.expression.value, name=name)
+            load = self._generate_load(node.expression.value, int_reg(name))
             asm += load
         elif type(node.expression) is Variable:
             if type(node.var) is Array:
-                asm.append(f'stw @INT({node.expression}), @ARRAY({node.var}[{node.var.index}])(r1)')
+                asm.append(Instr('stw', int_reg(node.expression),
+                                 Mem(ArraySlot(node.var.name, node.var.index),
+                                     'r1')))
                 handled = True
             else:
-                asm.append(f'mr @INT({name}), @INT({node.expression})')
+                asm.append(Instr('mr', int_reg(name),
+                                 int_reg(node.expression)))
         elif type(node.expression) is Array:
-            asm.append(f'lwz @INT({name}), @ARRAY({node.expression}[{node.expression.index}])(r1)')
+            array = node.expression
+            asm.append(Instr('lwz', int_reg(name),
+                             Mem(ArraySlot(array.name, array.index), 'r1')))
         elif type(node.expression) is Pointer:
             if node.expression.type == 'array':
-                asm.append(f'addi @INT({name}), r1, @ARRAY({arg})')
+                asm.append(Instr('addi', int_reg(name), 'r1',
+                                 ArraySlot(str(arg))))
             else:
                 # placeholders
-                asm.append(f'lis @INT({name}), &{node.expression}')
-                asm.append(f'addi @INT({name}), @INT({name}), &{node.expression}')
+                target = Address(str(node.expression))
+                asm.append(Instr('lis', int_reg(name), target))
+                asm.append(Instr('addi', int_reg(name), int_reg(name), target))
         elif type(node.expression) is Cast:
-            asm += [f'fctiwz @FLOAT(_ftemp_), @FLOAT({node.expression.var})',
-                    f'stfd @FLOAT(_ftemp_), 0x8(r1)',
-                    f'lwz @INT({name}), 0xc(r1)']
+            asm += [Instr('fctiwz', float_reg('_ftemp_'),
+                          float_reg(node.expression.var)),
+                    Instr('stfd', float_reg('_ftemp_'), Mem(8, 'r1')),
+                    Instr('lwz', int_reg(name), Mem(0xc, 'r1'))]
             self.casts = True
         elif type(node.expression) is Call:
             asm += self._assemble_call(node.expression)
             if type(node.var) is Array:
-                asm.append(f'stw @INT(_r3_), @ARRAY({node.var}[{node.var.index}])(r1)')
+                asm.append(Instr('stw', int_reg('_r3_'),
+                                 Mem(ArraySlot(node.var.name, node.var.index),
+                                     'r1')))
                 handled = True
             else:
-                asm.append(f'mr @INT({name}), @INT(_r3_)')
+                asm.append(Instr('mr', int_reg(name), int_reg('_r3_')))
         else:
             asm += self._generate_math(node.expression, f'{name}')
         if type(node.var) is Array and not handled:
-            asm.append(f'stw @INT({name}), @ARRAY({node.var}[{node.var.index}])(r1)')
+            asm.append(Instr('stw', int_reg(name),
+                             Mem(ArraySlot(node.var.name, node.var.index),
+                                 'r1')))
         return asm
 
     def _assemble_fset(self, node):
@@ -806,85 +2287,127 @@ class Assembler:
         asm = []
         if type(node.expression) is Variable:
             if type(node.var) is Array:
-                asm.append(f'stfs @FLOAT({node.expression}), @ARRAY({node.var}[{node.var.index}])(r1)')
+                asm.append(Instr('stfs', float_reg(node.expression),
+                                 Mem(ArraySlot(node.var.name, node.var.index),
+                                     'r1')))
                 handled = True
             else:
-                asm.append(f'fmr @FLOAT({name}), @FLOAT({node.expression})')
+                asm.append(Instr('fmr', float_reg(name),
+                                 float_reg(node.expression)))
         elif type(node.expression) is Array:
-            asm.append(f'lfs @FLOAT({name}), @ARRAY({node.expression}[{node.expression.index}])(r1)')
+            array = node.expression
+            asm.append(Instr('lfs', float_reg(name),
+                             Mem(ArraySlot(array.name, array.index), 'r1')))
         elif type(node.expression) is Cast:
-            asm += [f'lis @INT(_temp_), 0x4330',
-                    f'stw @INT(_temp_), 0x8(r1)',
-                    f'stw @INT({node.expression.var}), 0xc(r1)',
-                    f'lfd @FLOAT({name}), 0x8(r1)',
-                    f'lfd @FLOAT(_ftemp_), -0x7ff8(r2)', # 4330000000000000h
-                    f'fsubs @FLOAT({name}), @FLOAT({name}), @FLOAT(_ftemp_)']
+            asm += [Instr('lis', int_reg('_temp_'), 0x4330),
+                    Instr('stw', int_reg('_temp_'), Mem(8, 'r1')),
+                    Instr('stw', int_reg(node.expression.var), Mem(0xc, 'r1')),
+                    Instr('lfd', float_reg(name), Mem(8, 'r1')),
+                    Instr('lfd', float_reg('_ftemp_'),
+                          Mem(-0x7ff8, 'r2')), # 4330000000000000h
+                    Instr('fsubs', float_reg(name), float_reg(name),
+                          float_reg('_ftemp_'))]
             self.casts = True
         elif type(node.expression) is Call:
             asm += self._assemble_call(node.expression)
             if type(node.var) is Array:
-                asm.append(f'stfs @FLOAT(_f1_), @ARRAY({node.var}[{node.var.index}])(r1)')
+                asm.append(Instr('stfs', float_reg('_f1_'),
+                                 Mem(ArraySlot(node.var.name, node.var.index),
+                                     'r1')))
                 handled = True
             else:
-                asm.append(f'fmr @FLOAT({name}), @FLOAT(_f1_)')
+                asm.append(Instr('fmr', float_reg(name), float_reg('_f1_')))
         else:
             asm += self._generate_fmath(node.expression, f'{name}')
         if type(node.var) is Array and not handled:
-            asm.append(f'stfs @FLOAT({name}), @ARRAY({node.var}[{node.var.index}])(r1)')
+            asm.append(Instr('stfs', float_reg(name),
+                             Mem(ArraySlot(node.var.name, node.var.index),
+                                 'r1')))
         return asm
 
     def _assemble_loadstore(self, node):
+        var = VReg(str(node.var), node.type)
         if type(node.offset) is Number:
-            return [f'{node.opcode} @{node.type.upper()}({node.var}), {node.offset}(@INT({node.base}))']
+            return [Instr(node.opcode, var,
+                          Mem(node.offset.value, int_reg(node.base)))]
         else:
-            return [f'{node.opcode}x @{node.type.upper()}({node.var}), @INT({node.base}), @INT({node.offset})']
+            return [Instr(f'{node.opcode}x', var, int_reg(node.base),
+                          int_reg(node.offset))]
 
-    def _generate_load(self, value, name='_temp_'):
+    def _generate_load(self, value, reg):
         asm = []
-        if value > 0xffff:
+        if value >= 0xffff8000:
+            # fits as a negative
+            asm.append(Instr('li', reg, value - 0x100000000))
+        elif value > 0xffff:
             upper = value >> 0x10
             lower = value & 0xffff
             if lower & 0x8000 != 0:
               upper += 1
             if upper & 0x8000 != 0:
-              asm.append(f'lis @INT({name}), -{hex(-upper & 0xffff)}')
+              asm.append(Instr('lis', reg, -(-upper & 0xffff)))
             else:
-              asm.append(f'lis @INT({name}), {hex(upper)}')
+              asm.append(Instr('lis', reg, upper))
             if lower & 0x8000 != 0:
-              asm.append(f'subi @INT({name}), @INT({name}), {hex(-lower & 0xffff)}')
+              asm.append(Instr('subi', reg, reg, -lower & 0xffff))
             elif lower > 0:
-              asm.append(f'addi @INT({name}), @INT({name}), {hex(lower)}')
+              asm.append(Instr('addi', reg, reg, lower))
         elif value > 0x7fff:
-            asm.append(f'lis @INT({name}), 0x1')
-            asm.append(f'subi @INT({name}), @INT({name}), {hex(0x10000 - value)}')
+            asm.append(Instr('lis', reg, 1))
+            asm.append(Instr('subi', reg, reg, 0x10000 - value))
         else:
-            asm.append(f'li @INT({name}), {hex(value)}')
+            asm.append(Instr('li', reg, value))
         return asm
 
+    # addresses always take two instructions so that they can be
+    # patched in place once the layout is known
+    def _generate_address_load(self, addr, reg):
+        load = [str(line) for line in self._generate_load(addr, reg)]
+        if len(load) == 1:
+            load.append(f'addi {reg}, {reg}, 0x0')
+        return load
+
+    # long chains of operations nest down the left side, so they are
+    # worked out innermost first in a loop, each into the temp the
+    # next one reads
     def _generate_math(self, op, dest, n=0):
+        chain = [op]
+        while chain[-1].operator not in ['insert', 'mod'] \
+              and type(chain[-1].left) is Operation:
+            chain.append(chain[-1].left)
+        dests = [dest] + [f'_temp{n}_'] * (len(chain) - 1)
+        asm = []
+        for op, dest in reversed(list(zip(chain, dests))):
+            asm += self._generate_operation(op, dest, n)
+        return asm
+
+    # an operation on the left has already been worked out into
+    # the first temp
+    def _generate_operation(self, op, dest, n):
         asm = []
         if op.operator == 'insert':
             if type(op.left.left) is Number:
                 nameL = f'_temp{n}_'
-                asm += self._generate_load(op.left.left.value, name=nameL)
+                asm += self._generate_load(op.left.left.value, int_reg(nameL))
                 n += 1
             else:
                 nameL = op.left.left.name
             mask = op.left.right.value
             if type(op.right) is Number:
                 nameR = f'_temp{n}_'
-                asm += self._generate_load(op.right.value, name=nameR)
+                asm += self._generate_load(op.right.value, int_reg(nameR))
             else:
                 nameR = op.right.name
             if not is_mask_contiguous(mask):
                 raise Exception(f"Non-contiguous insertion mask '{hex(mask)}'")
             start, end = get_mask_bounds(mask)
             size = end - start + 1 if end > start else 0x21 + end - start
-            asm += [f'mr @INT(_temp{n}_), @INT({nameL})',
-                    f'rlwimi @INT(_temp{n}_), @INT({nameR}), ' + \
-                    f'{hex((0x40 - start - size) % 0x20)}, {hex(start)}, ' + \
-                    f'{hex((start + size - 1) % 0x20)}',
-                    f'mr @INT({dest}), @INT(_temp{n}_)']
+            temp = int_reg(f'_temp{n}_')
+            asm += [Instr('mr', temp, int_reg(nameL)),
+                    Instr('rlwimi', temp, int_reg(nameR),
+                          (0x40 - start - size) % 0x20, start,
+                          (start + size - 1) % 0x20),
+                    Instr('mr', int_reg(dest), temp)]
             return asm
         elif op.operator == 'mod':
             mod = Operation('-', op.left,
@@ -892,18 +2415,23 @@ class Assembler:
                                       op.right))
             return self._generate_math(mod, dest, n)
         vars = []
-        for arg in [op.left, op.right]:
+        for i, arg in enumerate([op.left, op.right]):
             temp = f'_temp{n}_'
-            if type(arg) is Variable:
+            if type(arg) is Operation and i == 0:
+                vars.append(temp)
+                n += 1
+            elif type(arg) is Variable:
                 vars.append(arg.name)
             elif type(arg) is Array:
-                asm.append(f'lwz @INT({temp}), @ARRAY({arg}[{arg.index}])(r1)')
+                asm.append(Instr('lwz', int_reg(temp),
+                                 Mem(ArraySlot(arg.name, arg.index), 'r1')))
                 vars.append(temp)
                 n += 1
             elif type(arg) is Cast:
-                asm += [f'fctiwz @FLOAT(_ftemp_), @FLOAT({arg.var})',
-                        f'stfd @FLOAT(_ftemp_), 0x8(r1)',
-                        f'lwz @INT({temp}), 0xc(r1)']
+                asm += [Instr('fctiwz', float_reg('_ftemp_'),
+                              float_reg(arg.var)),
+                        Instr('stfd', float_reg('_ftemp_'), Mem(8, 'r1')),
+                        Instr('lwz', int_reg(temp), Mem(0xc, 'r1'))]
                 self.casts = True
                 vars.append(temp)
                 n+= 1
@@ -912,7 +2440,7 @@ class Assembler:
                                             or not is_mask_contiguous(arg.value))) \
                    or (op.operator in ['/', 'rshift', 'lshift'] and type(op.left) is Number) \
                    or (op.operator == '/' and not is_pow_of_two(arg.value)):
-                    asm += self._generate_load(arg.value, name=temp)
+                    asm += self._generate_load(arg.value, int_reg(temp))
                     vars.append(temp)
                     n += 1
                 else:
@@ -923,63 +2451,68 @@ class Assembler:
                 n += 1
         if len(vars) == 2:
             op = op_to_asm[op.operator]
-            asm.append(f'{op} @INT({dest}), @INT({vars[0]}), @INT({vars[1]})')
+            asm.append(Instr(op, int_reg(dest), int_reg(vars[0]),
+                             int_reg(vars[1])))
         elif len(vars) == 1:
             if op.operator == '/':
                 shift = 0x20 - int(math.log(const, 2))
-                asm.append(f'rlwinm @INT({dest}), @INT({vars[0]}), {hex(shift)}, {hex(0x20 - shift)}, 0x1f')
+                asm.append(Instr('rlwinm', int_reg(dest), int_reg(vars[0]),
+                                 shift, 0x20 - shift, 0x1f))
             # I assume rlwinm is faster than mulli, otherwise this is unneeded
             elif op.operator == '*' and is_pow_of_two(const):
                 shift = int(math.log(const, 2))
-                asm.append(f'rlwinm @INT({dest}), @INT({vars[0]}), {hex(shift)}, 0x0, {hex(0x1f - shift)}')
+                asm.append(Instr('rlwinm', int_reg(dest), int_reg(vars[0]),
+                                 shift, 0, 0x1f - shift))
             elif op.operator == '-' and type(op.left) is Number:
                 # not 100% sure it's kosher to hard-code temp here
-                asm.append(f'neg @INT(_temp_), @INT({vars[0]})')
-                asm.append(f'addi @INT({dest}), @INT(_temp_), {hex(const)}')
+                asm.append(Instr('neg', int_reg('_temp_'), int_reg(vars[0])))
+                asm.append(Instr('addi', int_reg(dest), int_reg('_temp_'),
+                                 const))
             elif op.operator == 'mask' and is_mask_contiguous(const):
                 start, end = get_mask_bounds(const)
-                asm.append(f'rlwinm @INT({dest}), @INT({vars[0]}), 0x0, {hex(start)}, {hex(end)}')
-            elif op.operator in ['rshift', 'lshift'] \
-                 and len(asm) > 0 and asm[-1].startswith('rlwinm'):
-                args = split_op(asm[-1])
-                start = int(args[4], 16)
-                end = int(args[5], 16)
-                # needs some error checking
-                if op.operator == 'lshift':
-                    rot = const
-                    start = max(start - const, 0)
-                    end = max(end - const, 0)
-                else:
-                    rot = 32 - const
-                    start = min(start + const, 31)
-                    end = min(end + const, 31)
-                asm[-1] = f'rlwinm @INT({dest}), @INT({args[2]}), {hex(rot)}, {hex(start)}, {hex(end)}'
+                asm.append(Instr('rlwinm', int_reg(dest), int_reg(vars[0]),
+                                 0, start, end))
             else:
                 op = op_imm_to_asm[op.operator]
-                asm.append(f'{op} @INT({dest}), @INT({vars[0]}), {hex(const)}')
+                asm.append(Instr(op, int_reg(dest), int_reg(vars[0]), const))
         else:
             print(op)
             raise Exception(f"Cannot operate between two literals")
         return asm
 
     def _generate_fmath(self, op, dest, n=0):
+        chain = [op]
+        while type(chain[-1].left) is Operation:
+            chain.append(chain[-1].left)
+        dests = [dest] + [f'_temp{n}_'] * (len(chain) - 1)
+        asm = []
+        for op, dest in reversed(list(zip(chain, dests))):
+            asm += self._generate_foperation(op, dest, n)
+        return asm
+
+    def _generate_foperation(self, op, dest, n):
         asm = []
         vars = []
-        for arg in [op.left, op.right]:
+        for i, arg in enumerate([op.left, op.right]):
             temp = f'_temp{n}_'
-            if type(arg) is Variable:
+            if type(arg) is Operation and i == 0:
+                vars.append(temp)
+                n += 1
+            elif type(arg) is Variable:
                 vars.append(arg.name)
             elif type(arg) is Array:
-                asm.append(f'lfs @FLOAT({temp}), @ARRAY({arg}[{arg.index}])')
+                asm.append(Instr('lfs', float_reg(temp),
+                                 ArraySlot(arg.name, arg.index)))
                 vars.append(temp)
                 n += 1
             elif type(arg) is Cast:
-                asm += [f'lis @INT(_temp_), 0x4330',
-                        f'stw @INT(_temp_), 0x8(r1)',
-                        f'stw @INT({arg.var}), 0xc(r1)',
-                        f'lfd @FLOAT({temp}), 0x8(r1)',
-                        f'lfd @FLOAT(_ftemp_), -0x7ff8(r2)',
-                        f'fsubs @FLOAT({temp}), @FLOAT({temp}), @FLOAT(_ftemp_)']
+                asm += [Instr('lis', int_reg('_temp_'), 0x4330),
+                        Instr('stw', int_reg('_temp_'), Mem(8, 'r1')),
+                        Instr('stw', int_reg(arg.var), Mem(0xc, 'r1')),
+                        Instr('lfd', float_reg(temp), Mem(8, 'r1')),
+                        Instr('lfd', float_reg('_ftemp_'), Mem(-0x7ff8, 'r2')),
+                        Instr('fsubs', float_reg(temp), float_reg(temp),
+                              float_reg('_ftemp_'))]
                 self.casts = True
                 vars.append(temp)
                 n += 1
@@ -988,7 +2521,8 @@ class Assembler:
                 vars.append(temp)
                 n += 1
         op = fop_to_asm[op.operator]
-        asm.append(f'{op} @FLOAT({dest}), @FLOAT({vars[0]}), @FLOAT({vars[1]})')
+        asm.append(Instr(op, float_reg(dest), float_reg(vars[0]),
+                         float_reg(vars[1])))
         return asm
 
     def next_branch_index(self):
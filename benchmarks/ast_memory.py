@@ -0,0 +1,51 @@
+# Measures the memory held by the syntax tree of a generated script.
+#
+#   python benchmarks/ast_memory.py [statements]
+
+import gc, os, sys, tempfile, tracemalloc
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from reader import Reader
+from linter import Linter
+
+def make_script(statements, per_function=50):
+    lines = ['<region="ntsc-u">', '']
+    for n in range(0, statements, per_function):
+        lines += [f'def FUNC_{n}(int base, int idx):',
+                  '  alloc buf = int[4]',
+                  '  set total = 0']
+        for i in range(per_function):
+            if i % 5 == 0:
+                lines.append(f'  lwz val, {hex(4 * i)}(base)')
+            elif i % 5 == 1:
+                lines.append(f'  set total = total + val * {hex(i)} - idx mask 0xff')
+            elif i % 5 == 2:
+                lines.append(f'  set buf[{i % 4}] = total')
+            elif i % 5 == 3:
+                lines.append(f'  set total = buf[{i % 4}] + base + idx * 0x14')
+            else:
+                lines.append(f'  stw total, {hex(4 * i)}(base)')
+        lines += ['return total', '']
+    return '\n'.join(lines)
+
+def main():
+    statements = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'corpus.pbr')
+        with open(path, 'w') as f:
+            f.write(make_script(statements))
+        with Reader(path) as reader:
+            tracemalloc.start()
+            linter = Linter(reader)
+            linter.lint()
+            tree = linter.syntax_tree()
+    # drop the tokens and linter state, keeping only the tree
+    del linter, reader
+    gc.collect()
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{statements} statements in {len(tree)} functions')
+    print(f'syntax tree: {size / 0x100000:.1f} MiB')
+    print(f'peak while linting and parsing: {peak / 0x100000:.1f} MiB')
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,12 @@
 import os, sys
 from reader import Reader
+from cache import Cache
 from linter import Linter
-from parser import Parser
 from assembler import Assembler
 from compiler import Compiler
+from watcher import Watcher
 
-def build(path, addr):
+def check_target(path, addr, optimize):
     path = os.path.abspath(path)
     os.chdir(os.path.dirname(path))
     name, ext = os.path.splitext(path)
@@ -13,21 +14,32 @@ def build(path, addr):
         sys.exit(f"File must be of type '.pbr', not '{ext}'")
     if addr < 0x80000000 or addr > 0xffffffff:
         sys.exit(f"Address out of bounds")
+    if optimize not in ['speed', 'size']:
+        sys.exit(f"Can only optimize for 'speed' or 'size', not '{optimize}'")
+    return path
+
+def build(path, addr, use_cache=True, jobs=1, optimize='speed',
+          stats=False):
+    path = check_target(path, addr, optimize)
+    name = os.path.splitext(path)[0]
+    cache = Cache('__pbrcache__') if use_cache else None
     with Reader(path) as reader:
-        linter = Linter(reader)
+        linter = Linter(reader, cache)
         print('Linting...')
-        linter.lint()
+        linter.lint(jobs)
         print('Done.')
     region = linter.region
     print('Parsing...')
     ast = []
-    for path in linter.files:
-        with Reader(path) as reader:
-            parser = Parser(reader)
-            ast += parser.parse()
+    # unchanged files come straight from the cache
+    for file in linter.files.values():
+        ast += file.syntax_tree()
     print('Done.')
-    assembler = Assembler(region, addr, ast)
-    asm = assembler.assemble()
+    assembler = Assembler(region, addr, ast, optimize)
+    asm = assembler.assemble(jobs)
+    if stats and len(assembler.hits) > 0:
+        print('Peephole:', ', '.join(f'{rule} x{count}' for rule, count
+                                     in assembler.hits.items()))
     with open(f'{name}.asm', 'w+') as f:
         for line in asm:
             f.write(line + '\n')
@@ -40,3 +52,8 @@ def build(path, addr):
 ##    for line in asm:
 ##        print(f'{addr:08x} : {line}')
 ##        addr += 4
+
+# rebuilds on every save until interrupted
+def watch(path, addr, interval=0.5, use_cache=True, optimize='speed'):
+    path = check_target(path, addr, optimize)
+    Watcher(path, addr, use_cache, optimize).run(interval)
@@ -0,0 +1,98 @@
+import gc, hashlib, os, pickle
+
+# everything that affects how a file is linted or parsed; changing any
+# of these invalidates every cached syntax tree
+front_end = ['lexer.py', 'linter.py',
+             'data/classes.py', 'data/ops.py', 'data/pbr_globals.py']
+
+def compiler_version():
+    root = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha256()
+    for name in front_end:
+        with open(os.path.join(root, name), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+class Cache:
+    def __init__(self, directory, max_size=0x4000000):
+        self.directory = directory
+        self.max_size = max_size
+        self.version = compiler_version()
+
+    def key(self, text):
+        digest = hashlib.sha256(self.version.encode())
+        digest.update(text.encode())
+        return digest.hexdigest()
+
+    def load(self, key):
+        path = os.path.join(self.directory, f'{key}.pickle')
+        # unpickling a large tree allocates enough objects to set off
+        # repeated garbage collections, none of which can free anything
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+            # mark as recently used for eviction
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        finally:
+            if enabled:
+                gc.enable()
+        return entry
+
+    def store(self, key, entry):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'{key}.pickle')
+        temp = f'{path}.{os.getpid()}.tmp'
+        try:
+            with open(temp, 'wb') as f:
+                pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+        except RecursionError:
+            # trees nested too deeply to pickle are just not cached
+            os.remove(temp)
+            return
+        os.replace(temp, path)
+        self._evict()
+
+    # drops least recently used entries until the cache fits
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.pickle'):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        size = sum(entry[1] for entry in entries)
+        for mtime, entry_size, name in sorted(entries):
+            if size <= self.max_size:
+                break
+            os.remove(os.path.join(self.directory, name))
+            size -= entry_size
+
+# also keeps entries in memory, for processes that build repeatedly;
+# without a directory nothing is written to disk
+class MemoryCache(Cache):
+    def __init__(self, directory=None, max_size=0x4000000):
+        super().__init__(directory, max_size)
+        self.entries = {}
+
+    def load(self, key):
+        if key not in self.entries:
+            if self.directory is None:
+                return None
+            entry = super().load(key)
+            if entry is None:
+                return None
+            self.entries[key] = entry
+        return self.entries[key]
+
+    def store(self, key, entry):
+        self.entries[key] = entry
+        if self.directory is not None:
+            super().store(key, entry)
+
+    # forgets every entry not in keys
+    def retain(self, keys):
+        self.entries = {key: self.entries[key] for key in keys
+                        if key in self.entries}
@@ -14,6 +14,11 @@ class Compiler:
         print('Done.')
         return output
 
+    # compiles a single line as if it were at the given address
+    def compile_line(self, line, address):
+        self.address = address
+        return self._compile_line(line)
+
     def _compile_line(self, line):
         tokens = self._split_line(line)
         op = tokens[0]
@@ -50,6 +55,8 @@ class Compiler:
             return self._compile_store(tokens)
         elif op in ['stbx', 'stbux', 'sthx', 'sthux']:
             return self._compile_store_indexed(tokens)
+        elif op in ['psq_l', 'psq_st']:
+            return self._compile_paired_single(tokens)
         elif op in ['b', 'bl']:
             return self._compile_branch(tokens)
         elif op in ['beq', 'bgt', 'bge', 'blt', 'ble', 'bne', 'bdnz']:
@@ -265,6 +272,18 @@ class Compiler:
         out = (prefix << 26) + (S << 21) + (A << 16) + (d & 0xffff)
         return out.to_bytes(4, 'big')
 
+    def _compile_paired_single(self, tokens):
+        op = tokens[0]
+        S = int(tokens[1][1:])
+        A = int(tokens[3][1:])
+        d = int(tokens[2], 16)
+        W = int(tokens[4])
+        I = int(tokens[5][2:])
+        prefix = 56 if op == 'psq_l' else 60
+        out = (prefix << 26) + (S << 21) + (A << 16) + (W << 15) + (I << 12) \
+              + (d & 0xfff)
+        return out.to_bytes(4, 'big')
+
     def _compile_store_indexed(self, tokens):
         op = tokens[0]
         S = int(tokens[1][1:])
@@ -1,12 +1,26 @@
 class Number:
-    def __init__(self, value):
-        self.value = value
-        self.type = 'int'
+    __slots__ = ('value',)
+    type = 'int'
+    # literals are immutable, so each value only needs one node
+    interned = {}
+
+    def __new__(cls, value):
+        node = cls.interned.get(value)
+        if node is None:
+            node = super().__new__(cls)
+            node.value = value
+            cls.interned[value] = node
+        return node
+
+    def __reduce__(self):
+        return (Number, (self.value,))
 
     def __str__(self):
         return hex(self.value)
 
 class Variable:
+    __slots__ = ('name', 'type')
+
     def __init__(self, name, type):
         self.name = name
         self.type = type
@@ -15,6 +29,8 @@ class Variable:
         return self.name
 
 class Array:
+    __slots__ = ('name', 'type', 'index')
+
     def __init__(self, name, type, index):
         self.name = name
         self.type = type
@@ -24,6 +40,8 @@ class Array:
         return self.name
 
 class Pointer:
+    __slots__ = ('target', 'type')
+
     def __init__(self, target, type):
         self.target = target
         self.type = type
@@ -32,11 +50,15 @@ class Pointer:
         return self.target
 
 class Cast:
+    __slots__ = ('var', 'type')
+
     def __init__(self, var, to):
         self.var = var
         self.type = to
 
 class Operation:
+    __slots__ = ('operator', 'left', 'right', 'type')
+
     def __init__(self, op, left, right):
         self.operator = op
         self.left = left
@@ -46,6 +68,8 @@ class Operation:
         self.type = left.type
 
 class Conditional:
+    __slots__ = ('comparator', 'left', 'right', 'type')
+
     def __init__(self, op, left, right):
         self.comparator = op
         self.left = left
@@ -55,18 +79,24 @@ class Conditional:
         self.type = left.type
 
 class CompoundConditional:
+    __slots__ = ('connective', 'left', 'right')
+
     def __init__(self, op, left, right):
         self.connective = op
         self.left = left
         self.right = right
 
 class Alloc:
+    __slots__ = ('var', 'type', 'size')
+
     def __init__(self, name, type, size):
         self.var = name
         self.type = type
         self.size = size
 
 class LoadStore:
+    __slots__ = ('opcode', 'var', 'base', 'offset', 'type')
+
     def __init__(self, op, var, base, offset):
         self.opcode = op
         self.var = var
@@ -75,18 +105,24 @@ class LoadStore:
         self.type = 'float' if 'f' in op else 'int'
 
 class Set:
+    __slots__ = ('type', 'var', 'expression')
+
     def __init__(self, type, var, expr):
         self.type = type
         self.var = var
         self.expression = expr
 
 class Call:
+    __slots__ = ('function', 'args', 'type')
+
     def __init__(self, func, args, type):
         self.function = func
         self.args = args
         self.type = type
 
 class Function:
+    __slots__ = ('name', 'params', 'body', 'return_')
+
     def __init__(self, name, params, body, return_):
         self.name = name
         self.params = params
@@ -97,26 +133,36 @@ class Function:
         return self.name
 
 class Switch:
+    __slots__ = ('var', 'blocks')
+
     def __init__(self, var, blocks):
         self.var = var
         self.blocks = blocks
 
 class Case:
+    __slots__ = ('cases', 'body')
+
     def __init__(self, cases, body):
         self.cases = cases
         self.body = body
 
 class If:
+    __slots__ = ('blocks',)
+
     def __init__(self, blocks):
         self.blocks = blocks
 
 class For:
+    __slots__ = ('var', 'range', 'body')
+
     def __init__(self, var, count, body):
         self.var = var
         self.range = count
         self.body = body
 
 class While:
+    __slots__ = ('condition', 'body')
+
     def __init__(self, condition, body):
         self.condition = condition
         self.body = body
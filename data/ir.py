@@ -0,0 +1,145 @@
+# instructions are kept as an opcode and operand objects while being
+# assembled, and are only turned into text once every register, offset
+# and address is known
+
+# virtual register; a variable, a generated temp (bookended by _), a
+# pre-colored function arg/return like _r3_ or a value hoisted out of
+# a loop (.hoist0)
+class VReg:
+    __slots__ = ('name', 'type')
+
+    def __init__(self, name, type):
+        self.name = name
+        self.type = type
+
+    # registers are identified by name alone
+    def __eq__(self, other):
+        return type(other) is VReg and other.name == self.name
+
+    def __hash__(self):
+        return hash(self.name)
+
+    def __str__(self):
+        return f'@{self.type.upper()}({self.name})'
+
+def int_reg(name):
+    return VReg(str(name), 'int')
+
+def float_reg(name):
+    return VReg(str(name), 'float')
+
+# offset(base)
+class Mem:
+    __slots__ = ('offset', 'base')
+
+    def __init__(self, offset, base):
+        self.offset = offset
+        self.base = base
+
+    def __str__(self):
+        offset = hex(self.offset) if type(self.offset) is int else self.offset
+        return f'{offset}({self.base})'
+
+# stack slot of an allocated array, or of one of its elements
+class ArraySlot:
+    __slots__ = ('name', 'index')
+
+    def __init__(self, name, index=None):
+        self.name = name
+        self.index = index
+
+    def __str__(self):
+        if self.index is None:
+            return f'@ARRAY({self.name})'
+        return f'@ARRAY({self.name}[{self.index}])'
+
+class SwitchTable:
+    __slots__ = ('index',)
+
+    def __init__(self, index):
+        self.index = index
+
+    def __str__(self):
+        return f'@SWITCH_TABLE({self.index})'
+
+# function called by name
+class Symbol:
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return f'@{self.name}'
+
+# address of a function, loaded with a lis/addi pair
+class Address:
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return f'&{self.name}'
+
+# operands are VRegs, physical registers (plain strings like 'r1'),
+# immediates (ints) or one of the above
+class Instr:
+    __slots__ = ('opcode', 'operands')
+
+    def __init__(self, opcode, *operands):
+        self.opcode = opcode
+        self.operands = operands
+
+    # registers read or written, in the order they are written out
+    def registers(self):
+        regs = []
+        for operand in self.operands:
+            if type(operand) is Mem:
+                operand = operand.base
+            if type(operand) is VReg or type(operand) is str:
+                regs.append(operand)
+        return regs
+
+    def vregs(self):
+        return [reg for reg in self.registers() if type(reg) is VReg]
+
+    # copy with virtual registers replaced per the given mapping
+    def assign(self, registers):
+        operands = []
+        for operand in self.operands:
+            if type(operand) is VReg:
+                operand = registers.get(operand, operand)
+            elif type(operand) is Mem and type(operand.base) is VReg:
+                operand = Mem(operand.offset,
+                              registers.get(operand.base, operand.base))
+            operands.append(operand)
+        return Instr(self.opcode, *operands)
+
+    def __str__(self):
+        if len(self.operands) == 0:
+            return self.opcode
+        operands = [hex(operand) if type(operand) is int else str(operand)
+                    for operand in self.operands]
+        return f"{self.opcode} {', '.join(operands)}"
+
+# branch target; also placed in the instruction list as a pseudo-op
+# marking where it points
+class Label(Instr):
+    __slots__ = ('index',)
+
+    def __init__(self, index):
+        super().__init__(None)
+        self.index = index
+
+    def __eq__(self, other):
+        return type(other) is Label and other.index == self.index
+
+    def __hash__(self):
+        return hash(self.index)
+
+    def assign(self, registers):
+        return self
+
+    def __str__(self):
+        return f'@BRANCH({self.index})'
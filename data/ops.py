@@ -11,7 +11,8 @@ store_ops = {'stb', 'stbu', 'stbux', 'stbx',
              'sth', 'sthu', 'sthux', 'sthx',
              'stw', 'stwu', 'stwux', 'stwx'}
 
-branch_ops = {'b', 'bctr', 'blt', 'ble', 'beq', 'bne', 'bgt', 'bge'}
+branch_ops = {'b', 'bctr', 'blt', 'ble', 'beq', 'bne', 'bgt', 'bge',
+              'bdnz'}
 
 compare_ops = {'cmplw', 'cmplwi', 'cmpw', 'cmpwi'}
 
@@ -0,0 +1,236 @@
+from data.classes import *
+
+mirrored_comps = {'eq': 'eq', 'ne': 'ne',
+                  'gt': 'lt', 'ge': 'le',
+                  'lt': 'gt', 'le': 'ge'}
+
+# ints are 32 bits wide and wrap around
+def to_signed(n):
+    n &= 0xffffffff
+    return n - 0x100000000 if n & 0x80000000 else n
+
+def is_pow_of_two(n):
+    return n > 0 and n & (n - 1) == 0
+
+# the value the assembled code would come up with
+def evaluate(operator, left, right):
+    left &= 0xffffffff
+    right &= 0xffffffff
+    if operator == '+':
+        n = left + right
+    elif operator == '-':
+        n = left - right
+    elif operator == '*':
+        n = left * right
+    elif operator in ['/', 'mod']:
+        if right == 0:
+            raise Exception(f"Division by zero")
+        # powers of two are divided by shifting, everything else by divw
+        if is_pow_of_two(right):
+            quotient = left // right
+        else:
+            quotient = abs(to_signed(left)) // abs(to_signed(right))
+            if (to_signed(left) < 0) != (to_signed(right) < 0):
+                quotient = -quotient
+        n = quotient if operator == '/' else left - quotient * right
+    elif operator == 'mask':
+        n = left & right
+    # srw/slw only look at the low 6 bits of the shift
+    elif operator == 'rshift':
+        n = left >> (right & 0x3f)
+    elif operator == 'lshift':
+        n = left << (right & 0x3f)
+    return n & 0xffffffff
+
+def compare(comparator, left, right):
+    # same as cmpwi/cmplwi against the right-hand literal
+    if right & 0xffffffff < 0x8000 or right < 0:
+        left, right = to_signed(left), to_signed(right)
+    else:
+        left, right = left & 0xffffffff, right & 0xffffffff
+    return {'eq': left == right, 'ne': left != right,
+            'gt': left > right, 'ge': left >= right,
+            'lt': left < right, 'le': left <= right}[comparator]
+
+# simplifies expressions and drops code behind conditions that are
+# always false, before anything is assembled; nodes are copied rather
+# than changed, since the tree may be cached
+def fold_function(node):
+    return Function(node.name, node.params, fold_block(node.body),
+                    node.return_)
+
+def fold_block(body):
+    block = []
+    for line in body:
+        line = fold_node(line)
+        if type(line) is list:
+            block += line
+        else:
+            block.append(line)
+    return block
+
+# arrays stay allocated even if the code that used them is gone
+def find_allocs(body):
+    allocs = []
+    for line in body:
+        if type(line) is Alloc:
+            allocs.append(line)
+        elif type(line) is If:
+            for _, block in line.blocks:
+                allocs += find_allocs(block)
+        elif type(line) is Switch:
+            for block in line.blocks:
+                allocs += find_allocs(block.body)
+        elif type(line) in [For, While]:
+            allocs += find_allocs(line.body)
+    return allocs
+
+def fold_node(node):
+    if type(node) is Set:
+        if node.type == 'float':
+            return node
+        return Set(node.type, node.var, fold_expression(node.expression))
+    elif type(node) is If:
+        blocks = []
+        removed = []
+        for i, (condition, body) in enumerate(node.blocks):
+            if condition is not None:
+                condition = fold_condition(condition)
+            if condition is False:
+                removed += body
+                continue
+            elif condition is True:
+                condition = None
+            blocks.append((condition, fold_block(body)))
+            # nothing after an else or an always-true branch runs
+            if condition is None:
+                for _, body in node.blocks[i+1:]:
+                    removed += body
+                break
+        if len(blocks) == 0:
+            return find_allocs(removed)
+        elif blocks[0][0] is None:
+            return find_allocs(removed) + blocks[0][1]
+        return find_allocs(removed) + [If(blocks)]
+    elif type(node) is While:
+        condition = fold_condition(node.condition)
+        if condition is False:
+            return find_allocs(node.body)
+        # loops need something to compare
+        elif condition is True:
+            condition = node.condition
+        return While(condition, fold_block(node.body))
+    elif type(node) is For:
+        return For(node.var, node.range, fold_block(node.body))
+    elif type(node) is Switch:
+        return Switch(node.var, [Case(block.cases, fold_block(block.body))
+                                 for block in node.blocks])
+    return node
+
+# True or False if the outcome is known up front
+def fold_condition(node):
+    if type(node) is CompoundConditional:
+        left = fold_condition(node.left)
+        right = fold_condition(node.right)
+        known = [side for side in [left, right] if type(side) is bool]
+        if node.connective == 'and':
+            if False in known:
+                return False
+            elif left is True:
+                return right
+            elif right is True:
+                return left
+        else:
+            if True in known:
+                return True
+            elif left is False:
+                return right
+            elif right is False:
+                return left
+        return CompoundConditional(node.connective, left, right)
+    if node.type == 'float':
+        return node
+    left = fold_expression(node.left)
+    right = fold_expression(node.right)
+    if type(left) is Number and type(right) is Number:
+        return compare(node.comparator, left.value, right.value)
+    # only variables and math can be compared against
+    if type(left) not in [Number, Variable, Operation]:
+        left = node.left
+    if type(right) not in [Number, Variable]:
+        right = node.right
+    comparator = node.comparator
+    if type(left) is Number and type(right) is Variable:
+        comparator = mirrored_comps[comparator]
+        left, right = right, left
+    # folded negatives compare as signed, same as a literal -4 would
+    if type(right) is Number and right not in [node.left, node.right] \
+       and right.value >= 0xffff8000:
+        right = Number(to_signed(right.value))
+    return Conditional(comparator, left, right)
+
+def is_foldable(node):
+    return type(node) is Operation and node.type != 'float' \
+           and node.operator != 'insert'
+
+# long chains of operations nest down the left side, so that side is
+# walked in a loop; right sides only hold tighter operators
+def fold_expression(node):
+    chain = []
+    while is_foldable(node):
+        chain.append(node)
+        node = node.left
+    for parent in reversed(chain):
+        node = fold_operation(parent.operator, node,
+                              fold_expression(parent.right))
+    return node
+
+# both sides have already been folded
+def fold_operation(op, left, right):
+    # a divisor can fold down to 0 even where it wasn't written as one;
+    # the division is still left for the assembled code to do
+    if type(right) is Number and right.value & 0xffffffff == 0 \
+       and op in ['/', 'mod']:
+        return Operation(op, left, right)
+    if type(left) is Number and type(right) is Number:
+        return Number(evaluate(op, left.value, right.value))
+    # keep literals on the right
+    if type(left) is Number and op in ['+', '*', 'mask']:
+        left, right = right, left
+    if type(right) is Number:
+        n = right.value & 0xffffffff
+        # x * 1, x mask 0, ...
+        if (n == 0 and op in ['rshift', 'lshift']) \
+           or (n == 1 and op in ['*', '/']) \
+           or (n == 0xffffffff and op == 'mask'):
+            return left
+        elif (n == 0 and op in ['*', 'mask']) or (n == 1 and op == 'mod'):
+            return Number(0)
+        # (x + 1) + 2 = x + 3, ...
+        if type(left) is Operation and type(left.right) is Number:
+            inner = left.operator
+            m = left.right.value & 0xffffffff
+            if inner in ['+', '-'] and op in ['+', '-']:
+                offset = (m if inner == '+' else -m) \
+                         + (n if op == '+' else -n)
+                return make_offset(left.left, offset)
+            elif inner == op and op in ['*', 'mask']:
+                return fold_operation(op, left.left,
+                                      Number(evaluate(op, m, n)))
+            elif inner == op and op in ['rshift', 'lshift'] \
+                 and m < 0x20 and n < 0x20:
+                if m + n >= 0x20:
+                    return Number(0)
+                return Operation(op, left.left, Number(m + n))
+        if op in ['+', '-']:
+            return make_offset(left, n if op == '+' else -n)
+    return Operation(op, left, right)
+
+# x plus some wrapped-around offset, as an add or a subtract
+def make_offset(node, offset):
+    offset &= 0xffffffff
+    if offset == 0:
+        return node
+    elif offset >= 0x80000000:
+        return Operation('-', node, Number(-offset & 0xffffffff))
+    return Operation('+', node, Number(offset))
@@ -1,128 +1,133 @@
 import re
+from array import array
+from itertools import accumulate
+
+# characters that end a token; all but whitespace are tokens themselves
+separators = r'()\[\]<>"&:,= \t\r\n'
+
+# splits a whole file into lexemes in one pass, skipping whitespace;
+# a comment is a single lexeme running up to and including its newline
+token_pattern = re.compile(rf'''[ \t\r]*(
+      [_0-9a-zA-Z]+(?![^{separators}])
+    | [()\[\]<>&:,=\n]
+    | //(?![^{separators}])[^\n]*\n?
+    | "[^"\n]*"?
+    | [^{separators}]+
+)''', re.VERBOSE)
+
+name_pattern = re.compile(r'[_0-9a-zA-Z]+')
+
+# same literals as int(token, 0)
+number_pattern = re.compile(r'''[+-]?(?:0[xX](?:_?[0-9a-fA-F])+
+                                    |0[bB](?:_?[01])+
+                                    |0[oO](?:_?[0-7])+
+                                    |0(?:_?0)*
+                                    |[1-9](?:_?[0-9])*)''', re.VERBOSE)
+
+keywords = {
+    **dict.fromkeys(['+', '-', '*', '/',
+                     'mask', 'insert', 'mod', 'lshift', 'rshift'], 'operator'),
+    **dict.fromkeys(['and', 'or'], 'connective'),
+    **dict.fromkeys(['int', 'float'], 'type'),
+    **dict.fromkeys(['alloc', 'break', 'call', 'case', 'continue', 'def',
+                     'elif', 'else', 'end', 'for', 'fset', 'if', 'import',
+                     'in', 'range', 'return', 'set', 'switch', 'while'],
+                    'reserved'),
+    **dict.fromkeys(['lbz', 'lbzu', 'lfd', 'lfdu', 'lfs', 'lfsu',
+                     'lha', 'lhau', 'lhz', 'lhzu', 'lwz', 'lwzu',
+                     'stb', 'stbu', 'stfd', 'stfdu', 'stfs', 'stfsu',
+                     'sth', 'sthu', 'stw', 'stwu'], 'load/store'),
+    **dict.fromkeys(['eq', 'ge', 'gt', 'le', 'lt', 'ne'], 'comparator'),
+}
+
+specials = {c: (c, None) for c in '()[]<>&:,=\n'}
+
+# a lexed file, shared by everything that needs to walk it
+class Tokens:
+    __slots__ = ('tokens', 'lines', 'error')
+
+    def __init__(self, tokens, error=None):
+        self.tokens = tokens
+        # lines[i] is the line number after consuming i tokens
+        self.lines = array('I', accumulate(
+            map(specials['\n'].__eq__, tokens), initial=1))
+        # message for a bad token following the last good one
+        self.error = error
+
+    def __len__(self):
+        return len(self.tokens)
 
 class Lexer:
-    def __init__(self, reader):
-        self.reader = reader
-        self.line = 1
-        self.iter = self.lex()
-        self.tokens = self._next_token()
-        self.next = next(self.iter)
-
-    def lex(self):
-        token = next(self.tokens)
-        while token is not None:
-            if token == '//':
-                self._scan_comment()
-                yield ('\n', None)
-            elif token == '"':
-                string = self._scan_string()
-                yield ('string', string)
-            elif self._is_special(token):
-                yield (token, None)
-            elif self._is_number(token):
-                yield ('number', token)
-            elif self._is_operation(token):
-                yield ('operator', token)
-            elif self._is_connective(token):
-                yield ('connective', token)
-            elif self._is_type(token):
-                yield ('type', token)
-            elif self._is_reserved(token):
-                yield ('reserved', token)
-            elif self._is_loadstore(token):
-                yield ('load/store', token)
-            elif self._is_comparator(token):
-                yield ('comparator', token)
-            elif self._is_variable(token):
-                yield ('variable', token)
-            elif self._is_function(token):
-                yield ('function', token)
+    def __init__(self, source):
+        if isinstance(source, Tokens):
+            self.tokens = source
+        else:
+            self.tokens = self.lex(source.buffer)
+        self.index = 0
+        self.next = self._peek(0)
+
+    @property
+    def line(self):
+        return self.tokens.lines[self.index]
+
+    def lex(self, buffer):
+        # each distinct lexeme is only classified once
+        seen = {word: (type_, word) for word, type_ in keywords.items()}
+        seen.update(specials)
+        self.errors = []
+        tokens = [seen[lexeme] if lexeme in seen
+                  else self._classify(lexeme, seen)
+                  for lexeme in token_pattern.findall(buffer)]
+        if self.errors:
+            # keep everything before the first bad token; the error
+            # is only reported once the stream reaches it
+            idx = min(tokens.index(error) for error in self.errors)
+            return Tokens(tokens[:idx], tokens[idx][1])
+        return Tokens(tokens)
+
+    def _classify(self, lexeme, seen):
+        c = lexeme[0]
+        if lexeme[:2] == '//' \
+           and (len(lexeme) == 2 or lexeme[2] in '()[]<>"&:,= \t\r\n'):
+            return specials['\n']
+        elif c == '"':
+            if len(lexeme) == 1 or lexeme[-1] != '"':
+                token = ('error', f"Unclosed string")
             else:
-                self.throw(f"Invalid token '{token}'")
-            token = next(self.tokens)
-        while True:
-            yield None
-
-    def _scan_comment(self):
-        token = ''
-        while token != '\n':
-            token = next(self.tokens)
-
-    def _scan_string(self):
-        s = ''
-        while (token := next(self.tokens)) not in '"\n':
-            s += token
-        if token != '"':
-            self.throw(f"Unclosed string")
-        return s
-
-    def _is_special(self, token):
-        return token in '()[]<>"&:,=\n'
-
-    def _is_operation(self, token):
-        return token in '+-*/' \
-               or token in ['mask', 'insert', 'mod', 'lshift', 'rshift']
-
-    def _is_connective(self, token):
-        return token in ['and', 'or']
-
-    def _is_number(self, token):
-        try:
-            val = int(token, 0)
-            if val > 0xffffffff:
-                self.throw(f"Int literal '{val}' exceeds 32-bit maximum")
-            return True
-        except:
-            return False
-
-    def _is_type(self, token):
-        return token in ['int', 'float']
-
-    def _is_reserved(self, token):
-        return token in ['alloc', 'and', 'break', 'call', 'case', 'continue',
-                         'def', 'elif', 'else', 'end', 'for', 'fset', 'if',
-                         'import', 'in', 'or', 'range', 'return', 'set',
-                         'switch', 'while']
-
-    def _is_loadstore(self, token):
-        return token in ['lbz', 'lbzu', 'lfd', 'lfdu', 'lfs', 'lfsu',
-                         'lha', 'lhau', 'lhz', 'lhzu', 'lwz', 'lwzu',
-                         'stb', 'stbu', 'stfd', 'stfdu', 'stfs', 'stfsu',
-                         'sth', 'sthu', 'stw', 'stwu']
-
-    def _is_comparator(self, token):
-        return token in ['eq', 'ge', 'gt', 'le', 'lt', 'ne']
-
-    def _is_variable(self, token):
-        return bool(re.match('[a-z]', token) and re.fullmatch('[_0-9a-zA-Z]+', token))
-
-    def _is_function(self, token):
-        return bool(re.match('[A-Z]', token) and re.fullmatch('[_0-9a-zA-Z]+', token))
-    
-    def _next_token(self):
-        token = ''
-        c = next(self.reader)
-        while c is not None:
-            if c in '()[]<>"&:,= \t\r\n':
-                if len(token) > 0:
-                    yield token
-                    token = ''
-                if self._is_special(c):
-                    yield c
+                # whitespace never makes it into a token
+                token = ('string', re.sub(r'[ \t\r]', '', lexeme[1:-1]))
+        elif number_pattern.fullmatch(lexeme):
+            if int(lexeme, 0) > 0xffffffff:
+                token = ('error', f"Int literal '{int(lexeme, 0)}' exceeds 32-bit maximum")
             else:
-                token += c
-            c = next(self.reader)
-        if len(token) > 0:
-            yield token
-        while True:
-            yield None
+                token = ('number', lexeme)
+        elif 'a' <= c <= 'z' and name_pattern.fullmatch(lexeme):
+            token = ('variable', lexeme)
+        elif 'A' <= c <= 'Z' and name_pattern.fullmatch(lexeme):
+            token = ('function', lexeme)
+        else:
+            token = ('error', f"Invalid token '{lexeme}'")
+        if token[0] == 'error':
+            self.errors.append(token)
+        seen[lexeme] = token
+        return token
+
+    def _peek(self, index):
+        tokens = self.tokens.tokens
+        if index < len(tokens):
+            return tokens[index]
+        elif self.tokens.error is not None:
+            self.throw(self.tokens.error, self.tokens.lines[index])
+        return None
 
     def __next__(self):
         val = self.next
-        if val and val[0] == '\n':
-            self.line += 1
-        self.next = next(self.iter)
+        if val is not None:
+            self.index += 1
+            self.next = self._peek(self.index)
         return val
 
-    def throw(self, msg):
-        raise Exception(f'{msg} (line {self.line})')
+    def throw(self, msg, line=None):
+        if line is None:
+            line = self.line
+        raise Exception(f'{msg} (line {line})')
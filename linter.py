@@ -1,21 +1,60 @@
 import os, re, sys
+from concurrent.futures import ProcessPoolExecutor
 from lexer import Lexer
 from reader import Reader
 from data.classes import *
 import data.pbr_globals as globals_
 import data.ops as ops
 
+OrderOfOps = {
+        'lshift': 1,
+        'rshift': 1,
+        'mod': 1,
+        'mask': 1,
+        'insert': 1,
+        '*': 2,
+        '/': 2,
+        '+': 3,
+        '-': 3,
+    }
+
 def is_operand(type):
     return type in ['number', 'variable', 'array[]', 'cast', 'operation']
 
-def path_in_set(paths, path):
-    return any(os.path.samefile(f, path) for f in paths)
+# identifies a file regardless of the path used to reach it
+def file_key(path):
+    stat = os.stat(path)
+    return (stat.st_dev, stat.st_ino)
+
+# lints the function bodies of a file in a worker process, carrying on
+# from where the header left off in the tokens lexed by the parent;
+# errors are handed back instead of raised so they can be reported in
+# import order
+def lint_functions(linter):
+    try:
+        linter._lint_functions()
+    except (SystemExit, Exception) as e:
+        return (None, None, None, e)
+    return (linter.functions, linter.function_uses, linter.tree, None)
 
 class Linter:
-    def __init__(self, reader):
+    def __init__(self, reader, cache=None):
         self.path = reader.path
-        self.lexer = Lexer(reader)
+        self.reader = reader
+        self.file_key = file_key(reader.path)
         self.region = None
+        self.error = None
+        self.cache = cache
+        self.entry = None
+        if cache is not None:
+            self.key = cache.key(reader.buffer)
+            self.entry = cache.load(self.key)
+
+    # worker processes get the lexer as it stands, not the source
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['reader'], state['cache']
+        return state
 
     def _get_operand_type(self, expr):
         if expr[0] == 'number':
@@ -32,8 +71,92 @@ class Linter:
             type_ = expr[4]
         return type_
 
-    def lint(self, linted=None):
-        # tags
+    def lint(self, jobs=1):
+        files = self._resolve_imports()
+        self._lint_bodies([file for file in files.values()
+                           if file.entry is None and file.error is None],
+                          jobs)
+        self._check_file(self, files, {})
+        self.files = files
+
+    # finds every file reachable through imports, linting just
+    # enough of each one to know what it imports
+    def _resolve_imports(self):
+        files = {}
+        stack = [self]
+        while stack:
+            file = stack.pop()
+            if file.file_key in files:
+                continue
+            files[file.file_key] = file
+            file._lint_header()
+            for path, key in zip(file.imports[::-1], file.import_keys[::-1]):
+                if key not in files:
+                    with Reader(path) as reader:
+                        stack.append(Linter(reader, self.cache))
+        return files
+
+    def _lint_header(self):
+        if self.entry is not None and self._is_entry_valid():
+            self.region = self.entry['region']
+            self.imports = self.entry['imports']
+            self.import_keys = [file_key(path) for path in self.imports]
+            self.functions = set(self.entry['functions'])
+            self.function_uses = self.entry['function_uses']
+            self.tree = self.entry['tree']
+            return
+        self.entry = None
+        try:
+            self.lexer = Lexer(self.reader)
+            self._lint_tags()
+            self._lint_imports()
+        except (SystemExit, Exception) as e:
+            self.error = e
+            self.imports = []
+            self.import_keys = []
+
+    def _lint_bodies(self, files, jobs):
+        if jobs is None:
+            jobs = os.cpu_count() or 1
+        if jobs > 1 and len(files) > 1:
+            with ProcessPoolExecutor(min(jobs, len(files))) as pool:
+                results = pool.map(lint_functions, files)
+                for file, result in zip(files, results):
+                    (file.functions, file.function_uses,
+                     file.tree, file.error) = result
+        else:
+            for file in files:
+                try:
+                    file._lint_functions()
+                except (SystemExit, Exception) as e:
+                    file.error = e
+
+    # every file's errors are collected first, however many processes
+    # linted them; the one reported is the first a depth-first walk of
+    # the imports, in the order they're written, would reach. Then
+    # checks that every function a file calls is defined in it or
+    # something it (indirectly) imports
+    def _check_file(self, file, files, visible):
+        if file.error is not None:
+            raise file.error
+        if file.file_key in visible:
+            return visible[file.file_key]
+        # guards against import cycles
+        visible[file.file_key] = file.functions
+        functions = set(file.functions)
+        for key in file.import_keys:
+            functions |= self._check_file(files[key], files, visible)
+        visible[file.file_key] = functions
+        for func in sorted(file.function_uses,
+                           key=lambda x: file.function_uses[x]):
+            if not func.startswith('FUN_') \
+               and func not in functions \
+               and func not in globals_.functions[file.region]:
+                file.throw(f"Function '{func}' is not defined",
+                           line=file.function_uses[func])
+        return functions
+
+    def _lint_tags(self):
         while self.lexer.next is not None \
               and self.lexer.next[1] not in ['import', 'def']:
             type_, token = next(self.lexer)
@@ -47,52 +170,118 @@ class Linter:
                 self.throw(f"Statements cannot appear outside of function bodies")
         if self.region is None:
             self.throw(f"Missing region tag")
-        # imports
-        imports = set()
+
+    def _lint_imports(self):
+        self.imports = []
+        self.import_keys = []
         while self.lexer.next is not None \
               and self.lexer.next[1] != 'def':
             type_, token = next(self.lexer)
             if token == 'import':
                 path = self._lint_import()
-                if path_in_set(imports, path):
+                key = file_key(path)
+                if key in self.import_keys:
                     self.throw(f"Duplicate import")
-                imports.add(path)
+                self.imports.append(path)
+                self.import_keys.append(key)
             elif type_ == '<':
                 self.throw(f"Tags must appear at the start of the file")
             elif type_ != '\n':
                 self.throw(f"Statements cannot appear outside of function bodies")
-        # functions
+
+    def _lint_functions(self):
         self.functions = set()
         self.function_uses = {}
+        self.tree = []
         while self.lexer.next is not None:
             type_, token = next(self.lexer)
             if token == 'def':
-                self._lint_def()
+                self.tree.append(self._lint_def())
             elif type_ == '<':
                 self.throw(f"Tags must appear at the start of the file")
             elif type_ != '\n':
                 self.throw(f"Statements cannot appear outside of function bodies")
 
-        # lint imported scripts recursively
-        if linted is None:
-            linted = set()
-        if not path_in_set(linted, self.path):
-            linted.add(self.path)
-            for path in imports:
-                with Reader(path) as reader:
-                    linter = Linter(reader)
-                    linter.lint(linted)
-                    self.functions |= linter.functions
-            # only validate function uses the first time a script is
-            # visited since future visits won't visit imports
-            for func in sorted(self.function_uses,
-                               key=lambda x: self.function_uses[x]):
-                if not func.startswith('FUN_') \
-                   and func not in self.functions \
-                   and func not in globals_.functions[self.region]:
-                    self.throw(f"Function '{func}' is not defined",
-                               line=self.function_uses[func])
-        self.files = linted
+    # a cached file was clean when stored, but its imports are
+    # resolved against the current working directory
+    def _is_entry_valid(self):
+        return all(os.path.exists(path)
+                   and file_key(path) != self.file_key
+                   for path in self.entry['imports'])
+
+    # the tree is built while linting; this only records it
+    def syntax_tree(self):
+        if self.entry is None and self.cache is not None:
+            self.entry = {'region': self.region,
+                          'imports': self.imports,
+                          'functions': self.functions,
+                          'function_uses': self.function_uses,
+                          'tree': self.tree}
+            self.cache.store(self.key, self.entry)
+        return self.tree
+
+    # builds the syntax tree node for an expression that has
+    # already been linted
+    def _make_node(self, expr):
+        if expr[0] == 'number':
+            return Number(int(expr[1], 0))
+        elif expr[0] in ['variable', 'array']:
+            return self.nodes[expr[1]]
+        elif expr[0] == 'array[]':
+            # share one node per array element
+            name, index = expr[1], expr[2]
+            if (name, index) not in self.elements:
+                type_ = self.nodes[name].type[:-2]
+                self.elements[(name, index)] = Array(name, type_, index)
+            return self.elements[(name, index)]
+        elif expr[0] == 'cast':
+            return Cast(expr[2], expr[1])
+        elif expr[0] == 'pointer':
+            return Pointer(expr[2], expr[1])
+        elif expr[0] == 'operation':
+            return self._make_operation(expr)
+        elif expr[0] == 'comparison':
+            return Conditional(expr[1], self._make_node(expr[2]),
+                               self._make_node(expr[3]))
+        elif expr[0] == 'conjunction':
+            return CompoundConditional(expr[1], self._make_node(expr[2]),
+                                       self._make_node(expr[3]))
+        elif expr[0] == 'range':
+            return self._make_node(expr[1])
+        elif expr[0] == 'call':
+            return expr[2]
+        return expr
+
+    # operations are linted strictly left to right; each operator is
+    # folded into the tree as soon as a looser one follows, so the
+    # tree comes out correctly associated
+    def _make_operation(self, expr):
+        chain = []
+        while expr[0] == 'operation':
+            chain.append((expr[1], expr[3]))
+            expr = expr[2]
+        operands = [self._make_node(expr)]
+        operators = []
+        for operator, operand in reversed(chain):
+            while operators \
+                  and OrderOfOps[operators[-1]] <= OrderOfOps[operator]:
+                self._reduce_operation(operators, operands)
+            operators.append(operator)
+            operands.append(self._make_node(operand))
+        while operators:
+            self._reduce_operation(operators, operands)
+        return operands[0]
+
+    def _reduce_operation(self, operators, operands):
+        right = operands.pop()
+        left = operands.pop()
+        operands.append(Operation(operators.pop(), left, right))
+
+    # variables keep the type they were first given
+    def _declare(self, name, type):
+        if name not in self.nodes:
+            self.nodes[name] = Variable(name, type)
+        return self.nodes[name]
 
     def _next_expression(self, expr=None, stop=False):
         if self.lexer.next[0] in ',):=\n':
@@ -120,8 +309,8 @@ class Linter:
                 if expr[0] != 'variable':
                     self.throw(f"Cannot cast type '{expr[0]}'")
                 if stop:
-                    return ('cast', to)
-                return self._next_expression(('cast', to))
+                    return ('cast', to, expr[1])
+                return self._next_expression(('cast', to, expr[1]))
             return expr
         elif self.lexer.next[0] == '[':
             next(self.lexer) # discard '['
@@ -137,7 +326,7 @@ class Linter:
                 self.throw(f"Array index out of bounds for array of size {size}")
             if next(self.lexer)[0] != ']':
                 self.throw(f"Invalid array; missing ']'")
-            return self._next_expression(('array[]', expr[1]))
+            return self._next_expression(('array[]', expr[1], index))
 
         type_, token = next(self.lexer)
         if type_ in ['number', 'variable']:
@@ -160,20 +349,9 @@ class Linter:
             self.function_uses[token] = self.lexer.line
             return (type_, token)
         elif type_ == 'operator':
-            left = expr
-            if left is None:
+            if expr is None:
                 self.throw(f"Invalid '{token}' operation")
-            elif not is_operand(left[0]):
-                self.throw(f"Cannot operate on type '{left[0]}'")
-            right = self._next_expression(stop=True)
-            if not is_operand(right[0]):
-                self.throw(f"Cannot operate on type '{right[0]}'")
-            if left[0] == right[0] == 'number':
-                self.throw(f"Operations between two literals are not supported")
-            type_ = self._get_operand_type(left)
-            if type_ != self._get_operand_type(right):
-                self.throw(f"Type mismatch in operation")
-            node = ('operation', token, left, right, type_)
+            node = self._lint_operation(token, expr)
             if stop:
                 return node
             return self._next_expression(node)
@@ -181,7 +359,7 @@ class Linter:
             left = expr
             if left is None:
                 self.throw(f"Invalid '{token}' comparison")
-            elif left[0] not in ['variable', 'operation']:
+            elif left[0] not in ['number', 'variable', 'operation']:
                 self.throw(f"Type '{left[0]}' cannot appear on the left of a comparison")
             # I don't think there's actually any issue here,
             # so I may end up allowing it
@@ -223,10 +401,27 @@ class Linter:
                 return ('range', arg)
             elif token == 'call':
                 func = self.lexer.next
-                self._lint_call()
-                return ('call', func)
+                return ('call', func, self._lint_call())
         return (type_, token)
 
+    # walks a whole chain of operators in one loop so long
+    # expressions don't recurse once per operator; the chain is
+    # kept left to right and only reordered by _make_operation
+    def _lint_operation(self, operator, left):
+        while True:
+            if not is_operand(left[0]):
+                self.throw(f"Cannot operate on type '{left[0]}'")
+            right = self._next_expression(stop=True)
+            if not is_operand(right[0]):
+                self.throw(f"Cannot operate on type '{right[0]}'")
+            type_ = self._get_operand_type(left)
+            if type_ != self._get_operand_type(right):
+                self.throw(f"Type mismatch in operation")
+            left = ('operation', operator, left, right, type_)
+            if self.lexer.next[0] != 'operator':
+                return left
+            operator = next(self.lexer)[1]
+
     def _lint_tag(self):
         type_, tag = next(self.lexer)
         if type_ != 'variable' or tag != 'region':
@@ -251,7 +446,7 @@ class Linter:
             self.throw(f"Invalid import statement")
         if not os.path.exists(path):
             self.throw(f"No such file: '{path}'")
-        elif os.path.samefile(self.path, path):
+        elif file_key(path) == self.file_key:
             self.throw(f"Attempted self-import")
         if next(self.lexer)[0] != '\n':
             self.throw(f"Invalid import statement")
@@ -259,6 +454,8 @@ class Linter:
 
     def _lint_def(self):
         self.variables = {}
+        self.nodes = {}
+        self.elements = {}
         self.in_loop = False
         self.in_switch = False
 
@@ -278,6 +475,7 @@ class Linter:
         if next(self.lexer)[0] != '(':
             self.throw("Invalid function definition; missing '('")
 
+        params = []
         while self.lexer.next[0] != ')':
             type_, type = next(self.lexer)
             if type not in ['int', 'float']:
@@ -286,16 +484,21 @@ class Linter:
             if type_ != 'variable':
                 self.throw("Invalid function definition")
             self.variables[var] = type
+            params.append(self._declare(var, type))
             if self.lexer.next[0] not in ',)':
                 self.throw("Invalid function definition")
             if self.lexer.next[0] == ',':
                 next(self.lexer)
         next(self.lexer) # discard ')'
-        self._lint_block('return')
+        body, _ = self._lint_block('return')
+        return_val = None
         if self.lexer.next:
             expr = self._next_expression()
             if expr[0] not in ['\n', 'variable']:
                 self.throw(f"Invalid return value of type '{expr[0]}")
+            elif expr[0] == 'variable':
+                return_val = self._make_node(expr)
+        return Function(name, tuple(params), body, return_val)
 
     def _lint_switch(self):
         expr = self._next_expression()
@@ -307,6 +510,8 @@ class Linter:
         if next(self.lexer)[0] != '\n':
             self.throw("Invalid 'case' statement")
         self.in_switch = True
+        var = self._make_node(expr)
+        blocks = []
         num_cases = 0
         default = False
         while self.lexer.next and self.lexer.next[1] != 'end':
@@ -317,6 +522,7 @@ class Linter:
                 if default:
                     self.throw(f"Additional cases cannot appear after a 'default' block")
                 # handle fall-through
+                cases = set()
                 while token == 'case':
                     num_cases += 1
                     type_, token = next(self.lexer)
@@ -324,14 +530,17 @@ class Linter:
                         self.throw(f"Invalid 'case' statement; missing case value")
                     elif int(token, 0) < 0:
                         self.throw("Case values cannot be negative")
-                    lines = self._lint_block(['case', 'break'])
-                    if lines[-1] == 'case' and len(lines) > 1:
+                    cases.add(int(token, 0))
+                    body, token = self._lint_block(['case', 'break'])
+                    if token == 'case' and len(body) > 0:
                         self.throw(f"Invalid case block; missing 'break' statement")
-                    token = lines[-1]
+                blocks.append(Case(tuple(cases), body))
             elif token == 'default':
                 if default:
                     self.throw(f"Switches cannot contain multiple 'default' blocks")
-                self._lint_block('break')
+                body, _ = self._lint_block('break')
+                if len(body) > 0:
+                    blocks.append(Case((), body))
                 # we don't just break because we need to
                 # consume any remaining newlines
                 default = True
@@ -343,43 +552,54 @@ class Linter:
             self.throw(f"Cannot have a switch statement without any 'case' blocks")
         next(self.lexer) # discard 'end'
         self.in_switch = False
+        return Switch(var, blocks)
 
     def _lint_if(self):
         expr = self._next_expression()
         if expr[0] not in ['comparison', 'conjunction']:
             self.throw(f"Invalid 'if' statement")
-        token = self._lint_block(['elif', 'else', 'end'])[-1]
+        condition = self._make_node(expr)
+        body, token = self._lint_block(['elif', 'else', 'end'])
+        blocks = [(condition, body)]
         while token == 'elif':
             expr = self._next_expression()
             if expr[0] not in ['comparison', 'conjunction']:
                 self.throw(f"Invalid 'elif' statement")
-            token = self._lint_block(['elif', 'else', 'end'])[-1]
+            condition = self._make_node(expr)
+            body, token = self._lint_block(['elif', 'else', 'end'])
+            blocks.append((condition, body))
         if token == 'else':
-            self._lint_block('end')
+            body, _ = self._lint_block('end')
+            blocks.append((None, body))
+        return If(blocks)
 
     def _lint_for(self):
         type_, var = next(self.lexer)
         if type_ != 'variable':
             self.throw(f"Invalid 'for' statement")
         self.variables[var] = 'int'
+        var = self._declare(var, 'int')
         if next(self.lexer)[1] != 'in':
             self.throw(f"Invalid 'for' statement; missing 'in'")
         expr = self._next_expression()
         if expr[0] != 'range':
             self.throw(f"Invalid 'for' statement; expected 'range', not '{expr[0]}'")
-        if expr[1][0] == 'variable' and expr[1][1] == var:
+        if expr[1][0] == 'variable' and expr[1][1] == var.name:
             self.throw(f"Cannot use '{var}' as both iterator and range argument")
         self.in_loop = True
-        self._lint_block('end')
+        body, _ = self._lint_block('end')
         self.in_loop = False
+        return For(var, self._make_node(expr), body)
 
     def _lint_while(self):
         expr = self._next_expression()
         if expr[0] not in ['comparison', 'conjunction']:
             self.throw(f"Invalid 'while' statement")
+        condition = self._make_node(expr)
         self.in_loop = True
-        self._lint_block('end')
+        body, _ = self._lint_block('end')
         self.in_loop = False
+        return While(condition, body)
 
     def _lint_alloc(self):
         type_, var = next(self.lexer)
@@ -404,6 +624,8 @@ class Linter:
         if next(self.lexer)[0] != ']':
             self.throw(f"Invalid 'alloc' statement; missing ']'")
         self.variables[var] = f'{type}[{size}]'
+        self.nodes[var] = Variable(var, f'{type}[]')
+        return Alloc(self.nodes[var], type, size)
 
     def _lint_call(self):
         expr = self._next_expression()
@@ -411,8 +633,13 @@ class Linter:
             self.throw(f"Invalid call statement")
         elif expr[0] == 'pointer' and expr[1] != 'variable':
             self.throw(f"Invalid pointer for function call")
+        if expr[0] == 'pointer':
+            name, type_ = expr[2], Pointer
+        else:
+            name, type_ = expr[1], Function
         if next(self.lexer)[0] != '(':
             self.throw(f"Invalid function call; missing '('")
+        args = []
         count = 0
         while self.lexer.next[0] != ')':
             expr = self._next_expression()
@@ -423,6 +650,7 @@ class Linter:
                 self.throw(msg)
             elif expr[0] == 'pointer' and expr[1] == 'variable':
                 self.throw(f"Cannot use '{expr[1]}' pointer as function argument")
+            args.append(self._make_node(expr))
             if self.lexer.next[0] not in ',)':
                 self.throw(f"Invalid function call")
             if self.lexer.next[0] == ',':
@@ -431,16 +659,18 @@ class Linter:
         next(self.lexer) # discard ')'
         if count > 8:
             self.throw(f"Cannot pass more than 8 parameters in a function call")
+        return Call(name, tuple(args), type_)
 
     def _lint_set(self, op):
         type_, var = next(self.lexer)
         if type_ != 'variable':
             self.throw(f"Invalid '{op}' statement; cannot assign to type '{type_}'")
         # handle array assignment
+        target = None
         if self.lexer.next[0] == '[':
             if var not in self.variables:
                 self.throw(f"Use of uninitialized variable '{var}'")
-            expr = self._next_expression(('array', var))
+            target = self._next_expression(('array', var))
         if next(self.lexer)[0] != '=':
             self.throw(f"Invalid '{op}' statement; missing '='")
         expr = self._next_expression()
@@ -456,31 +686,42 @@ class Linter:
             self.throw(f"Invalid '{op}' statement; value not of type '{type}'")
         if var not in self.variables:
             self.variables[var] = type
+        if target is None:
+            target = self._declare(var, type)
+        else:
+            target = self._make_node(target)
+        return Set(type, target, self._make_node(expr))
 
+    # operation chains only ever grow to the left, so they are
+    # walked in a loop and their operands checked left to right
     def _lint_set_r(self, expr):
-        if expr[0] == 'cast' and expr[1] != 'int':
-            self.throw(f"Cannot cast to type '{expr[1]}' in 'set' statement")
-        elif expr[0] == 'pointer' and expr[1] != 'function':
-            self.throw(f"Cannot assign '{expr[1]}' pointer to variable")
-        elif expr[0] == 'operation':
+        operands = []
+        while expr[0] == 'operation':
             if expr[1] == 'insert':
                 if expr[2][0] != 'operation' or expr[2][1] != 'mask':
                     self.throw(f"Cannot use 'insert' except after a 'mask' operation")
                 elif expr[2][3][0] != 'number':
                     self.throw(f"Insert mask must be of type 'number', not '{expr[2][0]}'")
-            self._lint_set_r(expr[2])
-            self._lint_set_r(expr[3])
+            operands.append(expr[3])
+            expr = expr[2]
+        for expr in [expr] + operands[::-1]:
+            if expr[0] == 'cast' and expr[1] != 'int':
+                self.throw(f"Cannot cast to type '{expr[1]}' in 'set' statement")
+            elif expr[0] == 'pointer' and expr[1] != 'function':
+                self.throw(f"Cannot assign '{expr[1]}' pointer to variable")
 
     def _lint_fset_r(self, expr):
-        if expr[0] == 'number':
-            self.throw(f"Float literals are not supported")
-        elif expr[0] == 'cast' and expr[1] != 'float':
-            self.throw(f"Cannot cast to type '{expr[1]}' in 'fset' statement")
-        elif expr[0] == 'operation':
+        operands = []
+        while expr[0] == 'operation':
             if expr[1] not in '+-*/':
                 self.throw(f"'{expr[1]}' is not a valid float operation")
-            self._lint_fset_r(expr[2])
-            self._lint_fset_r(expr[3])
+            operands.append(expr[3])
+            expr = expr[2]
+        for expr in [expr] + operands[::-1]:
+            if expr[0] == 'number':
+                self.throw(f"Float literals are not supported")
+            elif expr[0] == 'cast' and expr[1] != 'float':
+                self.throw(f"Cannot cast to type '{expr[1]}' in 'fset' statement")
 
     def _lint_loadstore(self, op):
         def throw(msg):
@@ -494,6 +735,10 @@ class Linter:
 
         if expr[0] != 'variable':
             self.throw(f"Invalid '{op}' statement")
+        if op in ops.load_ops:
+            var = self._declare(expr[1], self.variables[expr[1]])
+        else:
+            var = self._make_node(expr)
         if op.startswith('st'):
             type_ = self.variables[expr[1]]
             type = 'float' if op.startswith('stf') else 'int'
@@ -519,6 +764,8 @@ class Linter:
             throw(f"cannot use '{type_}' variable as base")
         if next(self.lexer)[0] != ')':
             throw(f"missing ')'")
+        return LoadStore(op, var, self._make_node(base),
+                         self._make_node(offset))
 
     # consumes token that triggered stop
     def _lint_block(self, stop_at):
@@ -529,52 +776,52 @@ class Linter:
         # support both one and multiple stop_at keywords
         if type(stop_at) is str:
             stop_at = [stop_at]
-        lines = []
+        body = []
         while self.lexer.next and not self.lexer.next[1] in stop_at:
             if self.lexer.next[0] == '\n':
                 next(self.lexer)
             else:
-                lines.append(self._lint_line())
+                body.append(self._lint_line())
         if not self.lexer.next:
             self.throw(f"Unclosed block")
-        lines.append(next(self.lexer)[1])
-        return lines
+        return (tuple(body), next(self.lexer)[1])
 
     def _lint_line(self):
         type_, token = next(self.lexer)
         if token == 'def':
             self.throw("Cannot define a function within a function")
         elif token == 'alloc':
-            self._lint_alloc()
+            node = self._lint_alloc()
         elif token == 'call':
-            self._lint_call()
+            node = self._lint_call()
         elif token in ['set', 'fset']:
-            self._lint_set(token)
+            node = self._lint_set(token)
         elif token == 'switch':
             if self.in_switch:
                 self.throw(f"Nested 'switch' statements are not supported")
-            self._lint_switch()
+            node = self._lint_switch()
         elif token == 'if':
-            self._lint_if()
+            node = self._lint_if()
         elif token == 'for':
             if self.in_loop:
                 self.throw(f"Nested loops are not supported")
-            self._lint_for()
+            node = self._lint_for()
         elif token == 'while':
             if self.in_loop:
                 self.throw(f"Nested loops are not supported")
-            self._lint_while()
+            node = self._lint_while()
         elif type_ == 'load/store':
-            self._lint_loadstore(token)
+            node = self._lint_loadstore(token)
         elif token in ['break', 'continue']:
             if not self.in_loop:
                 self.throw(f"Cannot use '{token}' outside of a loop")
+            node = (token,)
         else:
             self.throw(f"Invalid statement")
 
         if next(self.lexer)[0] != '\n':
             self.throw(f"Invalid '{token}' statement")
-        return token
+        return node
 
     def throw(self, msg, line=None):
         if line is None:
@@ -1,13 +1,13 @@
 class Reader:
     def __init__(self, path):
         self.path = path
+        self.buffer = None
         self.iter = self._next_char()
 
+    # the whole file is read once on entry; the buffer can be
+    # sliced directly, or consumed one character at a time
     def _next_char(self):
-        c = self.file.read(1)
-        while c != '':
-            yield c
-            c = self.file.read(1)
+        yield from self.buffer
         while True:
             yield None
 
@@ -15,8 +15,9 @@ class Reader:
         return next(self.iter)
 
     def __enter__(self):
-        self.file = open(self.path)
+        with open(self.path) as file:
+            self.buffer = file.read()
         return self
 
     def __exit__(self, exc_type, exc_value, exc_traceback):
-        self.file.close()
+        pass
@@ -0,0 +1,246 @@
+# A small interpreter for the integer code the assembler puts out, so
+# tests can check what assembled code does rather than how it reads.
+# Calls out of the script aren't run, only recorded, and clobber every
+# register a call is allowed to.
+
+import contextlib, os, re, sys, tempfile
+from unittest import mock
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from reader import Reader
+from linter import Linter
+from assembler import Assembler
+
+address = 0x80600000
+stack = 0x81000000
+# the game's routines for saving and restoring r14-r31 off r11
+save_gprs = 0x801cbd78
+restore_gprs = 0x801cbdc4
+
+def assemble(source, optimize='speed'):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'test.pbr')
+        with open(path, 'w') as f:
+            f.write(source)
+        cwd = os.getcwd()
+        try:
+            with Reader(path) as reader:
+                linter = Linter(reader)
+                linter.lint()
+            ast = []
+            for file in linter.files.values():
+                ast += file.syntax_tree()
+            assembler = Assembler(linter.region, address, ast, optimize)
+            asm = assembler.assemble()
+            return Machine(asm, assembler.functions, assembler.hits)
+        finally:
+            os.chdir(cwd)
+
+# the same, skipping the given passes of the assembler, to compare
+# against what they do
+def assemble_without(source, *passes, optimize='speed'):
+    with contextlib.ExitStack() as stack:
+        for name in passes:
+            stack.enter_context(mock.patch.object(Assembler, name,
+                                                  lambda self, asm: asm))
+        return assemble(source, optimize)
+
+def to_signed(n):
+    return n - 0x100000000 if n & 0x80000000 else n
+
+def rotate(n, rot):
+    return (n << rot | n >> (32 - rot)) & 0xffffffff
+
+# bits start through end, counting from the top and wrapping around
+def make_mask(start, end):
+    if start > end:
+        return ~make_mask(end + 1, start - 1) & 0xffffffff
+    return (1 << (32 - start)) - (1 << (31 - end))
+
+class Machine:
+    def __init__(self, asm, functions, hits):
+        self.asm = asm
+        self.functions = functions
+        self.hits = hits
+
+    # what a function returns in r3, along with the stores and calls it
+    # made in order; stores to its own stack frame are left out
+    def run(self, name, args, limit=100000):
+        self.regs = [0xdead0000 + n for n in range(32)]
+        self.regs[1] = stack
+        for n, arg in enumerate(args):
+            self.regs[3 + n] = arg & 0xffffffff
+        saved = self.regs[14:]
+        self.memory = {}
+        self.events = []
+        self.cr = 0
+        self.ctr = 0
+        self.lr = 0
+        pc = self.functions[name]
+        for _ in range(limit):
+            if pc == 0:
+                if self.regs[14:] != saved or self.regs[1] != stack:
+                    raise Exception('Saved register not restored')
+                return self.regs[3], self.events
+            pc = self.step(pc)
+        raise Exception('Ran too long')
+
+    def get(self, reg):
+        return self.regs[int(reg[1:])]
+
+    def set(self, reg, value):
+        self.regs[int(reg[1:])] = value & 0xffffffff
+
+    def load(self, addr, size):
+        value = 0
+        for i in range(size):
+            byte = (addr + i) & 0xffffffff
+            if byte not in self.memory:
+                # switch tables are words among the code
+                line = (byte - address) // 4
+                if 0 <= line < len(self.asm) \
+                   and self.asm[line].startswith('0x'):
+                    word = int(self.asm[line], 16)
+                    self.memory[byte] = word >> 8 * (3 - byte % 4) & 0xff
+                else:
+                    self.memory[byte] = byte * 0x9e3779b1 >> 24 & 0xff
+            value = value << 8 | self.memory[byte]
+        return value
+
+    def store(self, op, addr, size, value):
+        addr &= 0xffffffff
+        for i in range(size):
+            self.memory[addr + i] = value >> 8 * (size - 1 - i) & 0xff
+        # the caller's frame has a slot for lr too
+        if not stack - 0x10000 <= addr < stack + 8:
+            self.events.append((op, addr, value & (1 << 8 * size) - 1))
+
+    def compare(self, left, right):
+        self.cr = (left > right) - (left < right)
+
+    # anything outside the script; returns where to go on from
+    def call(self, target, pc):
+        if save_gprs - 0x48 <= target <= save_gprs:
+            for n in range((save_gprs - target) // 4):
+                self.store('stw', self.get('r11') - 4 * (n + 1), 4,
+                           self.regs[31 - n])
+        elif restore_gprs - 0x48 <= target <= restore_gprs:
+            for n in range((restore_gprs - target) // 4):
+                self.regs[31 - n] = self.load(self.get('r11') - 4 * (n + 1), 4)
+        elif target in self.functions.values():
+            self.lr = pc + 4
+            return target
+        else:
+            self.events.append(('call', target, self.regs[3]))
+            for n in [0] + list(range(4, 13)):
+                self.regs[n] = 0xbad00000 | len(self.events) << 8 | n
+            self.regs[3] = (target + len(self.events)) & 0xffff
+            self.ctr = 0xbad00000
+            self.cr = -1
+        return pc + 4
+
+    def step(self, pc):
+        line = self.asm[(pc - address) // 4]
+        op, *operands = re.split(r'[ ,()]+', line.strip())
+        values = []
+        for operand in operands:
+            if re.fullmatch(r'r[0-9]+', operand):
+                values.append(self.get(operand))
+            elif re.fullmatch(r'-?0x[0-9a-f]+|[0-9]+', operand):
+                values.append(int(operand, 0))
+            else:
+                values.append(None)
+        d, a, b = (values + [0, 0, 0])[:3]
+        size = {'w': 4, 'h': 2, 'b': 1}.get(op[1] if op[0] == 'l' else op[2:3])
+        conditions = {'beq': self.cr == 0, 'bne': self.cr != 0,
+                      'blt': self.cr < 0, 'ble': self.cr <= 0,
+                      'bgt': self.cr > 0, 'bge': self.cr >= 0}
+        if op == 'li':
+            self.set(operands[0], a)
+        elif op == 'lis':
+            self.set(operands[0], a << 16)
+        elif op in ['addi', 'subi']:
+            base = 0 if operands[1] == 'r0' else a
+            self.set(operands[0], base + b if op == 'addi' else base - b)
+        elif op == 'mr':
+            self.set(operands[0], a)
+        elif op == 'add':
+            self.set(operands[0], a + b)
+        elif op == 'sub':
+            self.set(operands[0], a - b)
+        elif op == 'neg':
+            self.set(operands[0], -a)
+        elif op in ['mullw', 'mulli']:
+            self.set(operands[0], to_signed(a) * to_signed(b & 0xffffffff))
+        elif op == 'divw':
+            # the result is undefined when dividing by 0; taken as 0 here
+            quotient = 0
+            if b != 0:
+                quotient = abs(to_signed(a)) // abs(to_signed(b))
+                if (to_signed(a) < 0) != (to_signed(b) < 0):
+                    quotient = -quotient
+            self.set(operands[0], quotient)
+        elif op == 'and':
+            self.set(operands[0], a & b)
+        elif op == 'andi.':
+            self.set(operands[0], a & b)
+            self.compare(to_signed(a & b), 0)
+        elif op in ['slw', 'srw']:
+            shift = b & 0x3f
+            value = a >> shift if op == 'srw' else a << shift
+            self.set(operands[0], value if shift < 32 else 0)
+        elif op == 'slwi':
+            self.set(operands[0], a << b)
+        elif op == 'srwi':
+            self.set(operands[0], a >> b)
+        elif op == 'srawi':
+            self.set(operands[0], to_signed(a) >> b)
+        elif op in ['rlwinm', 'rlwimi']:
+            mask = make_mask(values[3], values[4])
+            value = rotate(a, b) & mask
+            if op == 'rlwimi':
+                value |= d & ~mask
+            self.set(operands[0], value)
+        elif op in ['cmpw', 'cmpwi']:
+            self.compare(to_signed(d), to_signed(a & 0xffffffff))
+        elif op in ['cmplw', 'cmplwi']:
+            self.compare(d, a)
+        elif op == 'b':
+            return d
+        elif op in conditions:
+            return d if conditions[op] else pc + 4
+        elif op == 'bdnz':
+            self.ctr = (self.ctr - 1) & 0xffffffff
+            return d if self.ctr != 0 else pc + 4
+        elif op == 'bctr':
+            return self.ctr
+        elif op == 'bl':
+            return self.call(d, pc)
+        elif op == 'bctrl':
+            return self.call(self.ctr, pc)
+        elif op == 'blr':
+            return self.lr
+        elif op == 'mtctr':
+            self.ctr = d
+        elif op == 'mtlr':
+            self.lr = d
+        elif op == 'mflr':
+            self.set(operands[0], self.lr)
+        elif op in ['lwz', 'lhz', 'lbz', 'lha', 'lwzu', 'lhzu', 'lbzu']:
+            addr = (values[2] if operands[2] != 'r0' else 0) + a
+            value = self.load(addr, size)
+            if op == 'lha' and value & 0x8000:
+                value -= 0x10000
+            self.set(operands[0], value)
+            if op.endswith('u'):
+                self.set(operands[2], addr)
+        elif op in ['lwzx', 'lhzx', 'lbzx']:
+            addr = (0 if operands[1] == 'r0' else a) + b
+            self.set(operands[0], self.load(addr, size))
+        elif op in ['stw', 'sth', 'stb', 'stwu', 'sthu', 'stbu']:
+            addr = (values[2] if operands[2] != 'r0' else 0) + a
+            self.store(op[:3], addr, size, d)
+            if op.endswith('u'):
+                self.set(operands[2], addr)
+        else:
+            raise Exception(f'Unhandled: {op}')
+        return pc + 4
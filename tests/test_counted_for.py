@@ -0,0 +1,38 @@
+# Runs the code assembled for counted for loops and checks how many
+# times their bodies go around.
+#
+#   python -m unittest discover tests
+
+import unittest
+from ppc import assemble
+
+class CountedForTest(unittest.TestCase):
+    # the count used to share a register with a value computed before
+    # the loop, running the loop 4 * p1 times
+    def test_variable_range(self):
+        machine = assemble('<region="ntsc-u">\n'
+                           'def LOOP(int p0, int p1):\n'
+                           '  set v0 = p1 * 4\n'
+                           '  stw v0, 0x0(p0)\n'
+                           '  for i in range(p1):\n'
+                           '    stw i, 0x0(p0)\n'
+                           '  end\n'
+                           'return p0\n')
+        for p1 in [1, 2, 5]:
+            _, stores = machine.run('LOOP', [0x80400000, p1])
+            self.assertEqual(len(stores), 1 + p1)
+
+    # ranges below 1 still run the body once
+    def test_empty_range(self):
+        machine = assemble('<region="ntsc-u">\n'
+                           'def LOOP(int p0, int p1):\n'
+                           '  for i in range(p1):\n'
+                           '    stw i, 0x0(p0)\n'
+                           '  end\n'
+                           'return p0\n')
+        for p1 in [0, 0xffffffff]:
+            _, stores = machine.run('LOOP', [0x80400000, p1])
+            self.assertEqual(len(stores), 1)
+
+if __name__ == '__main__':
+    unittest.main()
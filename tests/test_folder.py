@@ -0,0 +1,97 @@
+# Runs code with and without constant folding and checks folding
+# doesn't change what it does. The assembler can't work out parts
+# made up only of literals itself, so the code it's compared against
+# has those written out.
+#
+#   python -m unittest discover tests
+
+import itertools, unittest
+from unittest import mock
+from ppc import assemble
+
+def function(name, lines, result):
+    return (f'def {name}(int p0, int p1):\n'
+            + ''.join(f'  {line}\n' for line in lines)
+            + f'return {result}\n')
+
+source = ('<region="ntsc-u">\n'
+          + function('MATH', ['set v0 = p0 + 0x14 * 3 - 4',
+                              'set v1 = p1 * 1 + 2 + 3 - 0x10',
+                              'set v2 = p1 lshift 2 lshift 3 mask 0xff0',
+                              'set v3 = p0 * 4 * 8 - 0xffffffff',
+                              'set v4 = p1 / 0x10 mod 0x3',
+                              'stw v0, 0x0(p0)',
+                              'stw v1, 0x4(p0)',
+                              'stw v2, 0x8(p0)',
+                              'stw v3, 0xc(p0)',
+                              'stw v4, 0x10(p0)'], 'p0')
+          # divisors that only come to 0 once folded
+          + function('DIVIDE', ['set v0 = p1 / 0x1 rshift 3',
+                                'set v1 = p0 / 0x4 mask 0x3',
+                                'set v2 = p1 mod 0',
+                                'stw v0, 0x0(p0)',
+                                'stw v1, 0x4(p0)',
+                                'stw v2, 0x8(p0)'], 'p0')
+          + function('CONDITIONS', ['set v0 = 1',
+                                    'if p1 + 0 gt 0x10:',
+                                    '  set v0 = 2',
+                                    'elif 0x8 * 2 gt 0x10:',
+                                    '  set v0 = 3',
+                                    'elif p1 * 1 lt 0xfffffff0:',
+                                    '  set v0 = 4',
+                                    'end',
+                                    'if 0x10 mask 0x3 eq 0:',
+                                    '  set v0 = v0 + 8',
+                                    'end'], 'v0'))
+
+reference = ('<region="ntsc-u">\n'
+             + function('MATH', ['set v0 = p0 + 0x3c - 4',
+                                 'set v1 = p1 * 1 + 2 + 3 - 0x10',
+                                 'set v2 = p1 lshift 2 lshift 3 mask 0xff0',
+                                 'set v3 = p0 * 4 * 8 - 0xffffffff',
+                                 'set v4 = p1 / 0x10 mod 0x3',
+                                 'stw v0, 0x0(p0)',
+                                 'stw v1, 0x4(p0)',
+                                 'stw v2, 0x8(p0)',
+                                 'stw v3, 0xc(p0)',
+                                 'stw v4, 0x10(p0)'], 'p0')
+             + function('DIVIDE', ['set v0 = p1 / 0',
+                                   'set v1 = p0 / 0',
+                                   'set v2 = p1 mod 0',
+                                   'stw v0, 0x0(p0)',
+                                   'stw v1, 0x4(p0)',
+                                   'stw v2, 0x8(p0)'], 'p0')
+             + function('CONDITIONS', ['set v0 = 1',
+                                       'if p1 + 0 gt 0x10:',
+                                       '  set v0 = 2',
+                                       'elif p1 * 1 lt 0xfffffff0:',
+                                       '  set v0 = 4',
+                                       'end',
+                                       'set v0 = v0 + 8'], 'v0'))
+
+values = [0, 1, 3, 0x10, 0x11, 0x80400000, 0xffffffef, 0xffffffff]
+
+class FolderTest(unittest.TestCase):
+    def setUp(self):
+        self.machine = assemble(source)
+        with mock.patch('assembler.fold_function', lambda node: node):
+            self.reference = assemble(reference)
+
+    def check(self, name):
+        for args in itertools.product(values, repeat=2):
+            with self.subTest(args=args):
+                self.assertEqual(self.machine.run(name, args),
+                                 self.reference.run(name, args))
+
+    def test_math(self):
+        self.check('MATH')
+
+    # the division is still done, same as by a variable holding 0
+    def test_divide_by_zero(self):
+        self.check('DIVIDE')
+
+    def test_conditions(self):
+        self.check('CONDITIONS')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+# Linting a script together with its imports, in one process or
+# several.
+#
+#   python -m unittest discover tests
+
+import os, sys, tempfile, unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from reader import Reader
+from linter import Linter
+
+main = ('<region="ntsc-u">\n'
+        'import "{}"\n'
+        'import "{}"\n'
+        'def MAIN():\n'
+        '  call A()\n'
+        '  call B()\n'
+        'return\n')
+
+def library(name, body):
+    return ('<region="ntsc-u">\n'
+            f'def {name}():\n'
+            f'{body}'
+            'return\n')
+
+def lint(files, jobs):
+    with tempfile.TemporaryDirectory() as directory:
+        for name, source in files.items():
+            with open(os.path.join(directory, name), 'w') as f:
+                f.write(source)
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            with Reader('main.pbr') as reader:
+                linter = Linter(reader)
+                linter.lint(jobs)
+            return {os.path.basename(file.path): file.syntax_tree()
+                    for file in linter.files.values()}
+        finally:
+            os.chdir(cwd)
+
+class ImportTest(unittest.TestCase):
+    def test_workers(self):
+        files = {'main.pbr': main.format('a.pbr', 'b.pbr'),
+                 'a.pbr': library('A', '  set x = 1\n'),
+                 'b.pbr': library('B', '  set y = 2\n')}
+        for jobs in [1, 2]:
+            trees = lint(files, jobs)
+            self.assertEqual({name: [func.name for func in tree]
+                              for name, tree in trees.items()},
+                             {'main.pbr': ['MAIN'], 'a.pbr': ['A'],
+                              'b.pbr': ['B']})
+
+    # the first import to be written is the first to report an error,
+    # however the files were linted
+    def test_error_order(self):
+        body = '  set p = 1\n  set x = q\n'
+        for first, second in [('a.pbr', 'b.pbr'), ('b.pbr', 'a.pbr')]:
+            files = {'main.pbr': main.format(first, second),
+                     'a.pbr': library('A', body),
+                     'b.pbr': library('B', body)}
+            for jobs in [1, 2]:
+                with self.assertRaises(SystemExit) as context:
+                    lint(files, jobs)
+                self.assertEqual(str(context.exception),
+                                 f"[{first}] Use of uninitialized "
+                                 "variable 'q' (line 4)")
+
+if __name__ == '__main__':
+    unittest.main()
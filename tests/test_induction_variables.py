@@ -0,0 +1,71 @@
+# Runs loops with and without induction variable reduction and checks
+# stepping values along with the counter doesn't change what they do.
+#
+#   python -m unittest discover tests
+
+import unittest
+from ppc import assemble, assemble_without
+
+source = '''<region="ntsc-u">
+def STORES(int p0, int p1):
+  for i in range(p1):
+    set a = p0 + i * 4
+    stw i, 0x0(a)
+  end
+return p0
+
+def LOADS(int p0, int p1):
+  set s = 0
+  for i in range(p1):
+    set a = i * 12 + p0
+    lhz v, 0x6(a)
+    set s = s + v
+    set b = i * 12 + p0
+    stw s, 0x8(b)
+  end
+return s
+
+def STEPS(int p0, int p1):
+  set i = 0
+  set s = 0
+  while i lt p1:
+    set i = i + 2
+    if i eq 6:
+      continue
+    end
+    set a = i * 8 + p0
+    stw s, 0x0(a)
+    set s = s + a
+    call FUN_80001234(a)
+  end
+return i
+
+def DOWN(int p0, int p1):
+  set i = p1
+  while i gt 0:
+    set a = i * 0x20 + p0
+    stb i, -0x4(a)
+    set i = i - 1
+  end
+  set a = i * 4 + p0
+return a
+'''
+
+tests = ['STORES', 'LOADS', 'STEPS', 'DOWN']
+
+values = [0, 1, 2, 7, 13]
+
+class InductionVariableTest(unittest.TestCase):
+    def test_same_results(self):
+        machine = assemble(source)
+        reference = assemble_without(source, '_reduce_induction_variables')
+        # something has to have been stepped for this to mean anything
+        self.assertNotEqual(machine.asm, reference.asm)
+        for name in tests:
+            for p1 in values:
+                with self.subTest(name=name, p1=p1):
+                    self.assertEqual(machine.run(name, [0x80400000, p1]),
+                                     reference.run(name, [0x80400000, p1]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+# Expressions long enough to run past Python's recursion limit if any
+# step walks them recursively.
+#
+#   python -m unittest discover tests
+
+import os, sys, tempfile, unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from reader import Reader
+from linter import Linter
+from builder import build
+from data.classes import *
+
+operands = 10000
+
+def long_sum(count):
+    return ('<region="ntsc-u">\n'
+            'def SUM(int p0, int p1):\n'
+            '  set v0 = p0' + ' + p1' * (count - 1) + '\n'
+            '  stw v0, 0x0(p0)\n'
+            'return p0\n')
+
+class LongExpressionTest(unittest.TestCase):
+    def test_lint(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'test.pbr')
+            with open(path, 'w') as f:
+                f.write(long_sum(operands))
+            cwd = os.getcwd()
+            try:
+                with Reader(path) as reader:
+                    linter = Linter(reader)
+                    linter.lint(jobs=1)
+            finally:
+                os.chdir(cwd)
+        expr = linter.syntax_tree()[0].body[0].expression
+        count = 1
+        while type(expr) is Operation:
+            self.assertIs(type(expr.right), Variable)
+            expr = expr.left
+            count += 1
+        self.assertEqual(count, operands)
+
+    # every later step has to cope with the tree too
+    def test_build(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'test.pbr')
+            with open(path, 'w') as f:
+                f.write(long_sum(operands))
+            cwd = os.getcwd()
+            try:
+                build(path, 0x80600000)
+                # the cached tree is used the second time
+                build(path, 0x80600000)
+            finally:
+                os.chdir(cwd)
+            with open(os.path.join(directory, 'test.asm')) as f:
+                asm = f.read().split('\n')
+        self.assertEqual(sum(line.startswith('add ') for line in asm),
+                         operands - 1)
+
+if __name__ == '__main__':
+    unittest.main()
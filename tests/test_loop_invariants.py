@@ -0,0 +1,50 @@
+# Runs loops with and without invariant hoisting and checks hoisting
+# doesn't change what they do, however few registers are left over.
+#
+#   python -m unittest discover tests
+
+import unittest
+from ppc import assemble, assemble_without
+
+# a loop with count values live all the way through it
+def pressure(name, count, call):
+    names = [f'a{n}' for n in range(count)]
+    return (f'def {name}(int p0, int p1):\n'
+            + ''.join(f'  set {var} = p1 + {n + 1}\n'
+                      for n, var in enumerate(names))
+            + '  set i = 0\n'
+              '  while i lt 6:\n'
+              '    set t = p1 * 12 + 0x40\n'
+              '    set u = p0 + 0x100\n'
+              '    set w = u + i\n'
+              '    stw t, 0x0(w)\n'
+            + ('    call FUN_80001234(t)\n' if call else '')
+            + ''.join(f'    set {var} = {var} + t\n' for var in names[:4])
+            + '    set i = i + 1\n'
+              '  end\n'
+              f'  set s = {" + ".join(names)}\n'
+              '  stw s, 0x4(p0)\n'
+              'return s\n')
+
+tests = [(f'P{count}{"C" if call else ""}', count, call)
+         for count in [4, 12, 20, 28] for call in [False, True]]
+
+source = '<region="ntsc-u">\n' + '\n'.join(pressure(*test) for test in tests)
+
+values = [0, 1, 0x7fff, 0x80400000, 0xffffffff]
+
+class LoopInvariantTest(unittest.TestCase):
+    def test_same_results(self):
+        machine = assemble(source)
+        reference = assemble_without(source, '_hoist_invariants')
+        # something has to have been hoisted for this to mean anything
+        self.assertNotEqual(machine.asm, reference.asm)
+        for name, _, _ in tests:
+            for p0 in values:
+                for p1 in values:
+                    with self.subTest(name=name, args=(p0, p1)):
+                        self.assertEqual(machine.run(name, [p0, p1]),
+                                         reference.run(name, [p0, p1]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+# Runs code with and without the peephole rules and checks they don't
+# change what it does.
+#
+#   python -m unittest discover tests
+
+import itertools, unittest
+from ppc import assemble, assemble_without
+
+source = ('<region="ntsc-u">\n'
+          # a branch to a branch
+          'def NESTED(int a, int b):\n'
+          '  set r = 0\n'
+          '  if a gt 5:\n'
+          '    if b gt 5:\n'
+          '      set r = 1\n'
+          '    end\n'
+          '  end\n'
+          'return r\n'
+          '\n'
+          # shifts and masks that merge into one rotation
+          'def ROTATE(int a):\n'
+          '  set c = a mask 0xff lshift 24 rshift 26\n'
+          '  set d = a mask 0xf0 rshift 8\n'
+          '  set e = a * 4 rshift 1\n'
+          '  set t = c + d + e\n'
+          'return t\n'
+          '\n'
+          # the same compare made twice in a row
+          'def COMPARE(int a, int b):\n'
+          '  set r = 3\n'
+          '  if a lt 0:\n'
+          '    set r = 1\n'
+          '  elif a gt 0:\n'
+          '    set r = 2\n'
+          '  end\n'
+          '  while b gt 0:\n'
+          '    set b = b - 1\n'
+          '  end\n'
+          '  set t = r + b\n'
+          'return t\n'
+          '\n'
+          'def BRANCHES(int a, int b):\n'
+          '  set r = 0\n'
+          '  if a gt 5:\n'
+          '    if b gt 5:\n'
+          '      set r = 1\n'
+          '    else:\n'
+          '      set r = 2\n'
+          '    end\n'
+          '  else:\n'
+          '    set r = 3\n'
+          '  end\n'
+          '  if a lt 0 or a eq 0:\n'
+          '    set r = r + 4\n'
+          '  end\n'
+          'return r\n')
+
+values = [0, 1, 5, 6, 7, 0xff, 0xf0f, 0x80000000, 0xffffffff]
+
+class PeepholeTest(unittest.TestCase):
+    def test_same_results(self):
+        machine = assemble(source)
+        reference = assemble_without(source, '_run_peephole')
+        self.assertEqual(set(machine.hits), {'thread-branch',
+                                             'merge-rotations',
+                                             'repeated-compare'})
+        for name, count in [('NESTED', 2), ('ROTATE', 1),
+                            ('COMPARE', 2), ('BRANCHES', 2)]:
+            for args in itertools.product(values, repeat=count):
+                with self.subTest(name=name, args=args):
+                    self.assertEqual(machine.run(name, args),
+                                     reference.run(name, args))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+# Runs switches built for speed and for size and checks each goes to the
+# case it was given, whether it was lowered to a table or to compares.
+#
+#   python -m unittest discover tests
+
+import unittest
+from ppc import address, assemble
+
+def switch(name, cases, default=True):
+    lines = [f'def {name}(int m):', '  set r = 0', '  switch m:']
+    for n, case in enumerate(cases):
+        lines += [f'    case {hex(case)}:', f'      set r = {n + 1}',
+                  '      break']
+    if default:
+        lines += ['    default:', '      set r = 0x100', '      break']
+    return '\n'.join(lines + ['  end', 'return r', ''])
+
+tests = {
+    'DENSE': list(range(0x40, 0x58)),
+    'HOLES': [n for n in range(0x18) if n % 5 != 3],
+    'SPARSE': [0x5, 0x21, 0x57, 0x98, 0x100, 0x1a2, 0x2c0, 0x301,
+               0x4000, 0x12345, 0x80000000, 0xffffffff],
+    'FEW': [0x400, 0x10],
+}
+
+source = '<region="ntsc-u">\n' \
+         + '\n'.join(switch(name, cases, name != 'HOLES')
+                     for name, cases in tests.items())
+
+def expected(name, m):
+    cases = tests[name]
+    if m in cases:
+        return cases.index(m) + 1
+    return 0 if name == 'HOLES' else 0x100
+
+def lowered(machine, name):
+    start = (machine.functions[name] - address) // 4
+    ends = [(addr - address) // 4 for addr in machine.functions.values()
+            if addr > machine.functions[name]]
+    return machine.asm[start:min(ends, default=len(machine.asm))]
+
+class SwitchTest(unittest.TestCase):
+    def test_cases(self):
+        for optimize in ['speed', 'size']:
+            machine = assemble(source, optimize)
+            for name, cases in tests.items():
+                values = {0, 1, 0x7fffffff, 0x80000000, 0xffffffff}
+                for case in cases:
+                    values |= {case - 1 & 0xffffffff, case, case + 1}
+                for m in sorted(values):
+                    with self.subTest(optimize=optimize, name=name, m=m):
+                        r, _ = machine.run(name, [m])
+                        self.assertEqual(r, expected(name, m))
+
+    # a run of cases is worth a table when going for speed, but cases
+    # spread far apart never are
+    def test_lowering(self):
+        machine = assemble(source, 'speed')
+        self.assertIn('bctr', lowered(machine, 'DENSE'))
+        for optimize in ['speed', 'size']:
+            machine = assemble(source, optimize)
+            self.assertNotIn('bctr', lowered(machine, 'SPARSE'))
+            self.assertNotIn('bctr', lowered(machine, 'FEW'))
+
+if __name__ == '__main__':
+    unittest.main()
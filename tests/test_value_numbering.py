@@ -0,0 +1,67 @@
+# Runs code with and without value numbering and dead code removal
+# and checks they don't change what it does.
+#
+#   python -m unittest discover tests
+
+import itertools, unittest
+from ppc import address, assemble, assemble_without
+
+source = ('<region="ntsc-u">\n'
+          'def REPEATED(int p0, int p1):\n'
+          '  set v0 = p1 * 3 + p0\n'
+          '  set v1 = p1 * 3 + p0\n'
+          '  stw v0, 0x0(p0)\n'
+          '  stw v1, 0x4(p0)\n'
+          '  set v2 = p1 * 3\n'
+          '  if p1 gt 4:\n'
+          '    set v2 = p1 * 3 + 1\n'
+          '  end\n'
+          '  set v3 = p1 * 3 + p0\n'
+          '  stw v2, 0x8(p0)\n'
+          '  stw v3, 0xc(p0)\n'
+          'return v1\n'
+          '\n'
+          # a value never read right before a call, and a call whose
+          # result is never read
+          'def CALLS(int p0, int p1):\n'
+          '  set v0 = p1 * 7\n'
+          '  call FUN_80001234(p1)\n'
+          '  set v0 = p1 + 1\n'
+          '  stw v0, 0x0(p0)\n'
+          '  set v1 = call FUN_80005678(p0)\n'
+          '  set v2 = p1 + 1\n'
+          '  set v3 = p1 mask 0xff\n'
+          '  stw v2, 0x4(p0)\n'
+          'return p0\n')
+
+values = [0, 1, 4, 5, 0xff, 0x80400000, 0xffffffff]
+
+class ValueNumberingTest(unittest.TestCase):
+    def setUp(self):
+        self.machine = assemble(source)
+        self.reference = assemble_without(source, '_number_values',
+                                          '_remove_dead_code')
+
+    def check(self, name):
+        for args in itertools.product(values, repeat=2):
+            with self.subTest(args=args):
+                self.assertEqual(self.machine.run(name, args),
+                                 self.reference.run(name, args))
+
+    def test_repeated(self):
+        self.check('REPEATED')
+        self.assertLess(len(self.machine.asm), len(self.reference.asm))
+
+    # the value before the call is dropped, the call isn't
+    def test_calls(self):
+        self.check('CALLS')
+        start = (self.machine.functions['CALLS'] - address) // 4
+        self.assertFalse(any(line.startswith('mulli')
+                             for line in self.machine.asm[start:]))
+        _, events = self.machine.run('CALLS', [0x80400000, 1])
+        self.assertEqual([event[:2] for event in events],
+                         [('call', 0x80001234), ('stw', 0x80400000),
+                          ('call', 0x80005678), ('stw', 0x80400004)])
+
+if __name__ == '__main__':
+    unittest.main()
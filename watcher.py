@@ -0,0 +1,143 @@
+import hashlib, os, pickle, time
+from reader import Reader
+from cache import MemoryCache
+from linter import Linter
+from assembler import Assembler
+from compiler import Compiler
+
+# rebuilds a script whenever it or one of its imports is saved, only
+# redoing the work for what actually changed
+class Watcher:
+    def __init__(self, path, addr, use_cache=True, optimize='speed'):
+        self.path = path
+        self.name = os.path.splitext(path)[0]
+        self.addr = addr
+        self.optimize = optimize
+        self.cache = MemoryCache('__pbrcache__' if use_cache else None)
+        # contents each file was last built from, and the stat it had
+        # when last checked
+        self.digests = {}
+        self.stamps = {}
+        # file contents -> fingerprint of each function it defines
+        self.fingerprints = {}
+        # function fingerprint -> assembled function and its code
+        self.blobs = {}
+        self.code = {}
+
+    def run(self, interval=0.5):
+        self.rebuild()
+        print('Watching for changes...')
+        try:
+            while True:
+                time.sleep(interval)
+                if self.changed():
+                    self.rebuild()
+        except KeyboardInterrupt:
+            pass
+
+    # the mtime only says whether a file is worth hashing again; it
+    # has changed if it no longer hashes to what was last built
+    def changed(self):
+        changed = False
+        for path, digest in self.digests.items():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                changed = True
+                continue
+            stamp = (stat.st_mtime_ns, stat.st_size)
+            if self.stamps.get(path) == stamp:
+                continue
+            self.stamps[path] = stamp
+            with open(path) as f:
+                if self.cache.key(f.read()) != digest:
+                    changed = True
+        return changed
+
+    def rebuild(self):
+        start = time.perf_counter()
+        try:
+            count = self._rebuild()
+        except (SystemExit, Exception) as e:
+            print(e)
+            return
+        elapsed = time.perf_counter() - start
+        print(f'Rebuilt in {elapsed:.3f}s ({count} functions assembled)')
+
+    def _rebuild(self):
+        with Reader(self.path) as reader:
+            linter = Linter(reader, self.cache)
+            linter.lint()
+        assembler = Assembler(linter.region, self.addr, [], self.optimize)
+        nodes = []
+        fingerprints = {}
+        for file in linter.files.values():
+            self.digests[file.path] = file.key
+            tree = file.syntax_tree()
+            if file.key not in self.fingerprints:
+                self.fingerprints[file.key] = [self._fingerprint(node)
+                                               for node in tree]
+            fingerprints[file.key] = self.fingerprints[file.key]
+            nodes += zip(fingerprints[file.key], tree)
+
+        # only functions that changed are assembled again
+        changed = {fingerprint: node for fingerprint, node in nodes
+                   if fingerprint not in self.blobs}
+        self.blobs.update(zip(changed, assembler.assemble_functions(
+            list(changed.values()))))
+        blobs = [self.blobs[fingerprint] for fingerprint, _ in nodes]
+        asm = assembler.link(blobs)
+        with open(f'{self.name}.asm', 'w+') as f:
+            for line in asm:
+                f.write(line + '\n')
+        bin = self._compile([fingerprint for fingerprint, _ in nodes],
+                            blobs, asm)
+        with open(f'{self.name}.bin', 'wb+') as f:
+            f.write(bin)
+
+        # forget anything the project no longer uses
+        used = {fingerprint for fingerprint, _ in nodes}
+        self.fingerprints = fingerprints
+        self.blobs = {key: self.blobs[key] for key in used}
+        self.code = {key: self.code[key] for key in used if key in self.code}
+        self.cache.retain(fingerprints)
+        return len(changed)
+
+    # functions nested too deeply to pickle get a fingerprint of their
+    # own, so they are assembled again whenever their file changes
+    def _fingerprint(self, node):
+        try:
+            data = pickle.dumps(node, pickle.HIGHEST_PROTOCOL)
+        except RecursionError:
+            return os.urandom(32)
+        return hashlib.sha256(data).digest()
+
+    # branches within a function are relative, so a function's code
+    # only needs patching where it refers to absolute addresses or to
+    # other functions
+    def _compile(self, fingerprints, blobs, asm):
+        compiler = Compiler(self.addr, asm)
+        output = []
+        address = self.addr
+        for fingerprint, blob in zip(fingerprints, blobs):
+            patched = self._patched_lines(blob)
+            if fingerprint not in self.code:
+                self.code[fingerprint] = [
+                    None if i in patched else compiler.compile_line(line, 4 * i)
+                    for i, line in enumerate(blob.asm)]
+            code = self.code[fingerprint][:]
+            start = (address - self.addr) // 4
+            for i in patched:
+                code[i] = compiler.compile_line(asm[start + i], address + 4 * i)
+            output += code
+            address += 4 * len(blob.asm)
+        return b''.join(output)
+
+    def _patched_lines(self, blob):
+        patched = set()
+        for reloc in blob.relocations:
+            if reloc.kind == 'load':
+                patched |= {reloc.line, reloc.line + 1}
+            elif reloc.kind != 'branch' or reloc.symbol is not None:
+                patched.add(reloc.line)
+        return patched